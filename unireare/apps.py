@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class UnireareConfig(AppConfig):
     name = 'unireare'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,663 @@
+import io
+import json
+import math
+import random
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from . import catalog, search, trending
+from .buffers import flush_all
+from .models import *
+from .urls import urlpatterns
+
+PASSWORD = 'benchmark'
+
+# 生成标题与正文用的词表, 保证搜索索引有足够的重复词元
+WORDS = ['线性代数', '矩阵', '行列式', '特征值', '微积分', '极限', '导数', '积分', '概率论', '随机变量', '期望',
+         '方差', '数据结构', '链表', '二叉树', '哈希表', '图论', '算法', '复杂度', '操作系统', '进程', '线程',
+         '内存', '编译原理', '文法', '自动机', '大学物理', '力学', '电磁学', '光学', '英语', '阅读', '写作',
+         '复习', '笔记', '期末', '考点', '总结', '例题', '习题', '答案']
+
+
+def _text(rng, words, length):
+    text = ''
+    while len(text) < length:
+        text += rng.choice(words) + rng.choice('，。、；')
+    return text
+
+
+def _chunks(items, size=1000):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Fixture:
+    # 基准数据集中各场景使用的对象 id
+    def __init__(self):
+        self.users = []
+        self.spare_users = []
+        self.subjects = []
+        self.notes = []
+        self.paid_notes = []
+        self.hot_notes = []
+        self.own_notes = []
+        self.threads = []
+        self.replies = []
+        self.own_comments = []
+        self.messages = []
+        self.viewer = None
+        self.admin = None
+        self.sequence = 0
+        self.clients = {}
+
+    def next(self):
+        self.sequence += 1
+        return self.sequence
+
+    def pick(self, items, i):
+        return items[i % len(items)]
+
+    def client(self, user=None):
+        # 同一用户复用已登录的客户端
+        if user is None:
+            return Client()
+        if user.pk not in self.clients:
+            client = Client()
+            client.force_login(user)
+            self.clients[user.pk] = client
+        return self.clients[user.pk]
+
+
+def seed(users=2000, subjects=20, notes=3000, comments=15000, follows=20, messages=5000, random_seed=0):
+    rng = random.Random(random_seed)
+    fixture = Fixture()
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([
+        User(email='user%d@benchmark.unireare' % i, password=password, nickname='用户%d' % i,
+             school='大学%d' % (i % 50), major='专业%d' % (i % 30), tel=str(13000000000 + i))
+        for i in range(users)
+    ])
+    user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+    # 末尾的用户只留给封禁/激活等会改变用户状态的场景
+    fixture.users, fixture.spare_users = user_ids[:-50], user_ids[-50:]
+    fixture.viewer = User.objects.get(pk=user_ids[0])
+    fixture.admin = User.objects.create_superuser('admin@benchmark.unireare', PASSWORD, nickname='管理员')
+
+    Subject.objects.bulk_create([Subject(name='科目%d' % i) for i in range(subjects)])
+    fixture.subjects = list(Subject.objects.order_by('id').values_list('id', flat=True))
+
+    note_objects = []
+    for i in range(notes):
+        # 前 5% 的笔记属于 viewer, 便于草稿与修改场景
+        user = fixture.viewer.pk if i < notes // 20 else rng.choice(fixture.users)
+        is_free = rng.random() < 0.5
+        note_objects.append(Note(
+            user_id=user, subject_id=rng.choice(fixture.subjects), title=_text(rng, WORDS, 12)[:64],
+            content=_text(rng, WORDS, 400), is_free=is_free, price=None if is_free else rng.randint(1, 20),
+            is_draft=rng.random() < 0.1
+        ))
+    Note.objects.bulk_create(note_objects)
+    created = list(Note.objects.order_by('id'))
+    for note in created:
+        NoteToken.objects.bulk_create(search.note_tokens(note))
+    published = [note for note in created if not note.is_draft]
+    fixture.notes = [note.pk for note in published]
+    fixture.paid_notes = [note.pk for note in published if not note.is_free][:100]
+    fixture.for_sale = [note.pk for note in published if not note.is_free and note.user_id != fixture.viewer.pk
+                        and note.pk not in fixture.paid_notes]
+    User.objects.filter(pk=fixture.viewer.pk).update(balance=10 ** 6)
+    fixture.hot_notes = [note.pk for note in published if note.is_free][:20]
+    fixture.own_notes = [note.pk for note in created if note.user_id == fixture.viewer.pk]
+    Purchased.objects.bulk_create([Purchased(user=fixture.viewer, note_id=pk) for pk in fixture.paid_notes])
+    Collection.objects.bulk_create([Collection(user=fixture.viewer, note_id=pk) for pk in fixture.notes[::20]])
+    for subject, amount in Counter(note.subject_id for note in created).items():
+        Subject.objects.filter(pk=subject).update(note_amount=amount)
+
+    # 约 30% 的评论为顶层评论, 其余为楼中楼回复, 一半落在热门笔记上
+    commented = lambda: rng.choice(fixture.hot_notes) if rng.random() < 0.5 else rng.choice(fixture.notes)
+    Comment.objects.bulk_create([
+        Comment(user_id=rng.choice(fixture.users), note_id=commented(), content=_text(rng, WORDS, 40))
+        for _ in range(comments * 3 // 10)
+    ])
+    tops = list(Comment.objects.order_by('id').values_list('id', 'note_id'))
+    fixture.threads = [pk for pk, note in tops if note in fixture.hot_notes]
+    replies = []
+    for _ in range(comments - len(tops)):
+        pk, note = rng.choice(tops)
+        user = fixture.viewer.pk if rng.random() < 0.01 else rng.choice(fixture.users)
+        replies.append(Comment(user_id=user, note_id=note, upp_comment_id=pk, rep_comment_id=pk,
+                               content=_text(rng, WORDS, 40)))
+    # 一部分回复改为回复同一楼层中较早的回复, 形成较长的回复链
+    Comment.objects.bulk_create(replies[:len(replies) // 2])
+    earlier = defaultdict(list)
+    for pk, upp in Comment.objects.filter(upp_comment__isnull=False).values_list('id', 'upp_comment_id'):
+        earlier[upp].append(pk)
+    for reply in replies[len(replies) // 2:]:
+        if earlier[reply.upp_comment_id]:
+            reply.rep_comment_id = rng.choice(earlier[reply.upp_comment_id])
+    Comment.objects.bulk_create(replies[len(replies) // 2:])
+    fixture.replies = list(Comment.objects.filter(note__in=fixture.hot_notes, upp_comment__isnull=False)
+                           .order_by('id').values_list('id', flat=True)[:200])
+    fixture.own_comments = list(Comment.objects.filter(user=fixture.viewer).values_list('id', flat=True))
+    for note, amount in Counter(Comment.objects.values_list('note_id', flat=True)).items():
+        Note.objects.filter(pk=note).update(comment_amount=amount)
+
+    edges = set()
+    for user in fixture.users:
+        amount = 200 if user == fixture.viewer.pk else rng.randint(0, follows * 2)
+        for following in rng.sample(fixture.users, min(amount, len(fixture.users) - 1)):
+            if following != user:
+                edges.add((user, following))
+    for chunk in _chunks(sorted(edges)):
+        Follow.objects.bulk_create([Follow(follower_id=user, following_id=following) for user, following in chunk])
+    for user, amount in Counter(user for user, _ in edges).items():
+        User.objects.filter(pk=user).update(following_amount=amount)
+    for user, amount in Counter(following for _, following in edges).items():
+        User.objects.filter(pk=user).update(follower_amount=amount)
+    # viewer 关注的第一个用户视为粉丝过多的作者, 其笔记走读扩散, 其余笔记写入粉丝时间线
+    celebrity = min(following for user, following in edges if user == fixture.viewer.pk)
+    User.objects.filter(pk=celebrity).update(follower_amount=settings.FEED_FANOUT_MAX_FOLLOWERS)
+    followers = defaultdict(list)
+    for user, following in edges:
+        followers[following].append(user)
+    entries = [FeedEntry(user_id=user, note_id=note.pk, author_id=note.user_id)
+               for note in published if note.user_id != celebrity for user in followers[note.user_id]]
+    for chunk in _chunks(entries):
+        FeedEntry.objects.bulk_create(chunk)
+
+    Message.objects.bulk_create([
+        Message(from_user_id=rng.choice(fixture.users),
+                to_user_id=fixture.viewer.pk if rng.random() < 0.3 else rng.choice(fixture.users),
+                content=_text(rng, WORDS, 80))
+        for _ in range(messages)
+    ])
+    fixture.messages = list(Message.objects.filter(to_user=fixture.viewer).values_list('id', flat=True)[:100])
+
+    trending.compute()
+    fixture.viewer.refresh_from_db()
+    cache.clear()
+    catalog.invalidate()
+    return fixture
+
+
+def _image():
+    from PIL import Image as PILImage
+    content = io.BytesIO()
+    PILImage.new('RGB', (64, 64), (200, 120, 40)).save(content, 'PNG')
+    content.seek(0)
+    content.name = 'benchmark.png'
+    return content
+
+
+scenarios = []
+
+
+def scenario(route, name=None):
+    # 每个场景返回 (client, method, path, data), 准备数据的查询不计入结果
+    def decorator(prepare):
+        scenarios.append((name or route, route, prepare))
+        return prepare
+
+    return decorator
+
+
+@scenario('login')
+def _login(fixture, i):
+    return fixture.client(), 'post', '/api/login', {'email': fixture.viewer.email, 'password': PASSWORD}
+
+
+@scenario('logout')
+def _logout(fixture, i):
+    client = Client()
+    client.force_login(fixture.viewer)
+    return client, 'get', '/api/logout', {}
+
+
+@scenario('session')
+def _session(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/session', {}
+
+
+@scenario('register')
+def _register(fixture, i):
+    email = 'register%d@benchmark.unireare' % fixture.next()
+    EmailCode(email=email, code='123456').save()
+    return fixture.client(), 'post', '/api/register', {
+        'email': email, 'code': '123456', 'password': PASSWORD, 'confirm_password': PASSWORD, 'nickname': '新用户'
+    }
+
+
+@scenario('register_email_code')
+def _register_email_code(fixture, i):
+    email = 'code%d@benchmark.unireare' % fixture.next()
+    return fixture.client(), 'post', '/api/register_email_code', {'email': email}
+
+
+@scenario('reset_password')
+def _reset_password(fixture, i):
+    user = User.objects.get(pk=fixture.spare_users[0])
+    EmailCode(email=user.email, code='123456').save()
+    return fixture.client(), 'post', '/api/reset_password', {
+        'email': user.email, 'code': '123456', 'password': PASSWORD, 'confirm_password': PASSWORD
+    }
+
+
+@scenario('reset_password_email_code')
+def _reset_password_email_code(fixture, i):
+    return fixture.client(), 'post', '/api/reset_password_email_code', {'email': fixture.viewer.email}
+
+
+@scenario('user_info/<int:pk>')
+def _user_info(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/user_info/%d' % fixture.pick(fixture.users, i * 7), {}
+
+
+@scenario('disable_user/<int:pk>')
+def _disable_user(fixture, i):
+    pk = fixture.pick(fixture.spare_users[1:], i)
+    User.objects.filter(pk=pk).update(is_active=True)
+    return fixture.client(fixture.admin), 'get', '/api/disable_user/%d' % pk, {}
+
+
+@scenario('enable_user/<int:pk>')
+def _enable_user(fixture, i):
+    pk = fixture.pick(fixture.spare_users[1:], i)
+    User.objects.filter(pk=pk).update(is_active=False)
+    return fixture.client(fixture.admin), 'get', '/api/enable_user/%d' % pk, {}
+
+
+@scenario('modify_user_info')
+def _modify_user_info(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/modify_user_info', {
+        'nickname': '用户0', 'school': '大学0', 'major': '专业0', 'tel': '13000000000'
+    }
+
+
+@scenario('modify_user_motto')
+def _modify_user_motto(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/modify_user_motto', {'motto': '好好学习, 天天向上'}
+
+
+@scenario('modify_password')
+def _modify_password(fixture, i):
+    client = Client()
+    client.force_login(User.objects.get(pk=fixture.spare_users[0]))
+    return client, 'post', '/api/modify_password', {
+        'old_password': PASSWORD, 'password': PASSWORD, 'confirm_password': PASSWORD
+    }
+
+
+@scenario('upload_avatar')
+def _upload_avatar(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/upload_avatar', {'image': _image()}
+
+
+@scenario('upload_image')
+def _upload_image(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/upload_image', {'image': _image()}
+
+
+@scenario('send_message')
+def _send_message(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/send_message', {
+        'to_user': fixture.pick(fixture.users[1:], i), 'content': '你好'
+    }
+
+
+@scenario('message_list')
+def _message_list(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/message_list', {}
+
+
+@scenario('message_list', 'message_list?page')
+def _message_list_page(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/message_list', {'page': 3}
+
+
+@scenario('message_list', 'message_list?normalize')
+def _message_list_normalize(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/message_list', {'normalize': 1}
+
+
+@scenario('message/<int:pk>')
+def _message_view(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/message/%d' % fixture.pick(fixture.messages, i), {}
+
+
+@scenario('follow')
+def _follow(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/follow', {'following': fixture.pick(fixture.users[1:], i)}
+
+
+@scenario('following')
+def _following(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/following', {}
+
+
+@scenario('following', 'following?normalize')
+def _following_normalize(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/following', {'normalize': 1}
+
+
+@scenario('followers')
+def _followers(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/followers', {}
+
+
+@scenario('feed')
+def _feed(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/feed', {}
+
+
+@scenario('feed', 'feed?cursor')
+def _feed_cursor(fixture, i):
+    response = fixture.client(fixture.viewer).get('/api/feed')
+    return fixture.client(fixture.viewer), 'get', '/api/feed', {'cursor': json.loads(response.content)['data']['next_cursor']}
+
+
+@scenario('subject_list')
+def _subject_list(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/subject_list', {}
+
+
+@scenario('subject_list', 'subject_list?name')
+def _subject_list_name(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/subject_list', {'name': '科目1'}
+
+
+@scenario('add_subject')
+def _add_subject(fixture, i):
+    return fixture.client(fixture.admin), 'post', '/api/add_subject', {'name': '新科目%d' % fixture.next()}
+
+
+@scenario('modify_subject/<int:pk>')
+def _modify_subject(fixture, i):
+    pk = fixture.pick(fixture.subjects, i)
+    return fixture.client(fixture.admin), 'post', '/api/modify_subject/%d' % pk, {
+        'name': Subject.objects.get(pk=pk).name
+    }
+
+
+@scenario('delete_subject/<int:pk>')
+def _delete_subject(fixture, i):
+    subject = Subject.objects.create(name='待删除%d' % fixture.next())
+    return fixture.client(fixture.admin), 'get', '/api/delete_subject/%d' % subject.pk, {}
+
+
+@scenario('note_list')
+def _note_list(fixture, i):
+    return fixture.client(), 'get', '/api/note_list', {}
+
+
+@scenario('note_list', 'note_list?page')
+def _note_list_page(fixture, i):
+    return fixture.client(), 'get', '/api/note_list', {'page': 10}
+
+
+@scenario('note_list', 'note_list?cursor')
+def _note_list_cursor(fixture, i):
+    response = fixture.client().get('/api/note_list')
+    return fixture.client(), 'get', '/api/note_list', {'cursor': json.loads(response.content)['data']['next_cursor']}
+
+
+@scenario('note_list', 'note_list?subject')
+def _note_list_subject(fixture, i):
+    return fixture.client(), 'get', '/api/note_list', {'subject': fixture.pick(fixture.subjects, i)}
+
+
+@scenario('note_list', 'note_list?user')
+def _note_list_user(fixture, i):
+    return fixture.client(), 'get', '/api/note_list', {'user': fixture.viewer.pk}
+
+
+@scenario('note_list', 'note_list?keyword')
+def _note_list_keyword(fixture, i):
+    return fixture.client(), 'get', '/api/note_list', {'keyword': fixture.pick(WORDS, i)}
+
+
+@scenario('note_list', 'note_list?title')
+def _note_list_title(fixture, i):
+    return fixture.client(), 'get', '/api/note_list', {'title': fixture.pick(WORDS, i)}
+
+
+@scenario('note_list', 'note_list?stream')
+def _note_list_stream(fixture, i):
+    return fixture.client(), 'get', '/api/note_list', {'stream': 1}
+
+
+@scenario('note_list', 'note_list?normalize')
+def _note_list_normalize(fixture, i):
+    return fixture.client(), 'get', '/api/note_list', {'normalize': 1}
+
+
+@scenario('note_list', 'note_list?fields')
+def _note_list_fields(fixture, i):
+    return fixture.client(), 'get', '/api/note_list', {'fields': 'id,title,liking_amount'}
+
+
+@scenario('note_list', 'note_list?reactions')
+def _note_list_reactions(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/note_list', {'reactions': 1}
+
+
+@scenario('note_list', 'note_list?accessible')
+def _note_list_accessible(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/note_list', {'accessible': 1}
+
+
+@scenario('trending')
+def _trending(fixture, i):
+    return fixture.client(), 'get', '/api/trending', {}
+
+
+@scenario('trending', 'trending?subject')
+def _trending_subject(fixture, i):
+    return fixture.client(), 'get', '/api/trending', {'subject': fixture.pick(fixture.subjects, i)}
+
+
+@scenario('draft_list')
+def _draft_list(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/draft_list', {}
+
+
+@scenario('draft_list', 'draft_list?accessible')
+def _draft_list_accessible(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/draft_list', {'accessible': 1}
+
+
+@scenario('note/<int:pk>')
+def _note_view(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/note/%d' % fixture.pick(fixture.hot_notes, i), {}
+
+
+@scenario('note/<int:pk>', 'note/<int:pk>?paid')
+def _note_view_paid(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/note/%d' % fixture.pick(fixture.paid_notes, i), {}
+
+
+@scenario('add_note')
+def _add_note(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/add_note', {
+        'subject': fixture.pick(fixture.subjects, i), 'title': '新笔记%d' % i,
+        'content': _text(random.Random(i), WORDS, 400), 'is_free': True
+    }
+
+
+@scenario('modify_note/<int:pk>')
+def _modify_note(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/modify_note/%d' % fixture.pick(fixture.own_notes, i), {
+        'title': '修改后的笔记%d' % i, 'content': _text(random.Random(i), WORDS, 400)
+    }
+
+
+@scenario('delete_note/<int:pk>')
+def _delete_note(fixture, i):
+    note = Note.objects.create(user=fixture.viewer, subject_id=fixture.subjects[0], title='草稿',
+                               content=_text(random.Random(i), WORDS, 400), is_free=True, is_draft=True)
+    return fixture.client(fixture.viewer), 'get', '/api/delete_note/%d' % note.pk, {}
+
+
+@scenario('like_note/<int:pk>')
+def _like_note(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/like_note/%d' % fixture.pick(fixture.hot_notes, i), {}
+
+
+@scenario('unlike_note/<int:pk>')
+def _unlike_note(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/unlike_note/%d' % fixture.pick(fixture.hot_notes, i), {}
+
+
+@scenario('collect_note/<int:pk>')
+def _collect_note(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/collect_note/%d' % fixture.pick(fixture.hot_notes, i), {}
+
+
+@scenario('uncollect_note/<int:pk>')
+def _uncollect_note(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/uncollect_note/%d' % fixture.pick(fixture.hot_notes, i), {}
+
+
+@scenario('purchase_note/<int:pk>')
+def _purchase_note(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/purchase_note/%d' % fixture.for_sale[i], {}
+
+
+@scenario('collection_list')
+def _collection_list(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/collection_list', {}
+
+
+@scenario('collection_list', 'collection_list?normalize')
+def _collection_list_normalize(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/collection_list', {'normalize': 1}
+
+
+@scenario('comment_list/<int:pk>')
+def _comment_list(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/comment_list/%d' % fixture.pick(fixture.hot_notes, i), {}
+
+
+@scenario('comment_list/<int:pk>', 'comment_list/<int:pk>?normalize')
+def _comment_list_normalize(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/comment_list/%d' % fixture.pick(fixture.hot_notes, i), {
+        'normalize': 1
+    }
+
+
+@scenario('comment_replies/<int:pk>')
+def _comment_replies(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/comment_replies/%d' % fixture.pick(fixture.threads, i), {}
+
+
+@scenario('comment/<int:pk>')
+def _comment_view(fixture, i):
+    return fixture.client(fixture.viewer), 'get', '/api/comment/%d' % fixture.pick(fixture.replies, i), {}
+
+
+@scenario('add_comment')
+def _add_comment(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/add_comment', {
+        'note': fixture.pick(fixture.hot_notes, i), 'upp_comment': 0, 'rep_comment': 0, 'content': '好笔记'
+    }
+
+
+@scenario('add_comment', 'add_comment?reply')
+def _add_comment_reply(fixture, i):
+    upp_comment, note = Comment.objects.filter(pk=fixture.pick(fixture.threads, i)).values_list('id', 'note')[0]
+    return fixture.client(fixture.viewer), 'post', '/api/add_comment', {
+        'note': note, 'upp_comment': upp_comment, 'rep_comment': upp_comment, 'content': '同意'
+    }
+
+
+@scenario('modify_comment/<int:pk>')
+def _modify_comment(fixture, i):
+    return fixture.client(fixture.viewer), 'post', '/api/modify_comment/%d' % fixture.pick(
+        fixture.own_comments, i), {'content': '修改后的评论'}
+
+
+@scenario('delete_comment/<int:pk>')
+def _delete_comment(fixture, i):
+    comment = Comment.objects.create(user=fixture.viewer, note_id=fixture.pick(fixture.hot_notes, i), content='待删除')
+    return fixture.client(fixture.viewer), 'get', '/api/delete_comment/%d' % comment.pk, {}
+
+
+@scenario('profiling')
+def _profiling(fixture, i):
+    return fixture.client(fixture.admin), 'get', '/api/profiling', {}
+
+
+def missing_routes():
+    covered = {route for _, route, _ in scenarios}
+    return [str(pattern.pattern) for pattern in urlpatterns if str(pattern.pattern) not in covered]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def measure(fixture, prepare, repeat):
+    # 首次请求用于预热缓存, 不计入结果
+    samples = []
+    for i in range(repeat + 1):
+        client, method, path, data = prepare(fixture, i)
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            elapsed = time.perf_counter() - start
+        body = json.loads(content.decode())
+        if body['status'] != 'success':
+            raise ValueError('%s %s 返回错误: %s' % (method.upper(), path, content.decode()[:200]))
+        if i:
+            samples.append((len(queries), elapsed * 1000, len(content)))
+    return {
+        'queries': max(sample[0] for sample in samples),
+        'p50_ms': round(percentile([sample[1] for sample in samples], 50), 2),
+        'p99_ms': round(percentile([sample[1] for sample in samples], 99), 2),
+        'bytes': max(sample[2] for sample in samples),
+    }
+
+
+def run(fixture, repeat=20, only=None):
+    results = {}
+    for name, route, prepare in scenarios:
+        if only and route not in only and name not in only:
+            continue
+        # 计数缓冲按时间间隔写回, 每个场景开始前写回, 场景内的请求不会因间隔到期而多出写回的查询
+        flush_all()
+        results[name] = measure(fixture, prepare, repeat)
+    return results
+
+
+def check(results, budget):
+    # 返回超出预算的条目
+    violations = []
+    for name, result in results.items():
+        if name not in budget:
+            violations.append('%s: 预算文件中没有该场景' % name)
+            continue
+        for metric in ('queries', 'p99_ms', 'bytes'):
+            if metric in budget[name] and result[metric] > budget[name][metric]:
+                violations.append('%s: %s %s 超出预算 %s' % (name, metric, result[metric], budget[name][metric]))
+    return violations
+
+
+def make_budget(results, headroom=2.0):
+    # 查询数不留余量, 响应大小放宽 10%, 耗时按 headroom 放宽
+    return {
+        name: {
+            'queries': result['queries'],
+            'p99_ms': math.ceil(result['p99_ms'] * headroom),
+            'bytes': math.ceil(result['bytes'] * 1.1),
+        }
+        for name, result in results.items()
+    }
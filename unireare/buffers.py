@@ -0,0 +1,89 @@
+import atexit
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import caching, counters
+from .models import Collection, Like, Note
+
+
+class CounterBuffer:
+    # 在进程内累加计数, 每隔 interval 秒按对象合并为一条 UPDATE 写回数据库
+    def __init__(self, model, field, interval):
+        self.model = model
+        self.field = field
+        self.interval = interval
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def add(self, pk, amount=1):
+        # 返回该对象尚未写回的累计值; 本次调用触发写回时, 已写回的部分不再计入
+        with self._lock:
+            self._pending[pk] += amount
+            pending = self._pending[pk]
+            due = time.monotonic() - self._flushed_at >= self.interval
+        if due:
+            self.flush()
+            return self.pending(pk)
+        return pending
+
+    def pending(self, pk):
+        with self._lock:
+            return self._pending.get(pk, 0)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            with transaction.atomic():
+                self.write(pending)
+        except Exception:
+            with self._lock:
+                self._pending.update(pending)
+            raise
+        return len(pending)
+
+    def write(self, pending):
+        for pk, amount in pending.items():
+            counters.update(self.model, pk, **{self.field: amount})
+
+
+class RecountBuffer(CounterBuffer):
+    # 计数有对应的成员关系表时, 写回时按成员关系重新统计而不是累加增量:
+    # 进程异常退出丢失的增量会在该对象下次写回时纠正, 重复写回也不会重复计数
+    def __init__(self, model, field, interval, members, member_field):
+        super().__init__(model, field, interval)
+        self.members = members
+        self.member_field = member_field
+
+    def write(self, pending):
+        amount = self.members.objects.filter(**{self.member_field: OuterRef('pk')}).order_by().values(
+            self.member_field).annotate(amount=Count('id')).values('amount')
+        self.model.objects.filter(pk__in=list(pending)).update(**{
+            self.field: Coalesce(Subquery(amount, output_field=IntegerField()), 0)
+        })
+        for pk in pending:
+            caching.invalidate(self.model, pk)
+
+
+reading_counter = CounterBuffer(Note, 'reading_amount', settings.READING_COUNT_FLUSH_INTERVAL)
+# 热门笔记的点赞与收藏合并为一条 UPDATE
+liking_counter = RecountBuffer(Note, 'liking_amount', settings.LIKING_COUNT_FLUSH_INTERVAL, Like, 'note')
+collect_counter = RecountBuffer(Note, 'collect_amount', settings.COLLECT_COUNT_FLUSH_INTERVAL, Collection, 'note')
+
+
+def flush_all():
+    for counter in (reading_counter, liking_counter, collect_counter):
+        counter.flush()
+
+
+atexit.register(flush_all)
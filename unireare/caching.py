@@ -0,0 +1,147 @@
+from django.core.cache import cache
+
+from .models import Comment, Note, Subject, User
+
+# 缓存内容的结构变化时递增, 旧版本的缓存自然失效
+CACHE_VERSION = 2
+
+USER_LITE_KEYS = ('id', 'nickname', 'school', 'major', 'motto', 'following_amount', 'follower_amount', 'is_vip',
+                  'avatar', 'registered_at')
+
+COMMENT_LITE_KEYS = ('id', 'user', 'note', 'content', 'add_at', 'last_updated_at')
+
+# 与 lookups.get_note_versions 的校验值对应的笔记与科目字段
+NOTE_VERSION_KEYS = ('last_updated_at', 'comment_amount', 'liking_amount', 'collect_amount', 'purchase_amount')
+SUBJECT_VERSION_KEYS = ('last_updated_at', 'note_amount')
+
+
+def _key(name, pk):
+    return 'unireare:%s:%s' % (name, pk)
+
+
+def invalidate(model, pk):
+    cache.delete(_key(model._meta.model_name, pk), version=CACHE_VERSION)
+
+
+def _get_many(name, pks, load, current=None):
+    # current 为 {pk: 校验值} 时, 缓存中的校验值与之不符(其他进程已修改而本进程的缓存未清理)视为未命中
+    keys = {_key(name, pk): pk for pk in pks}
+    result = {keys[key]: value for key, value in cache.get_many(keys, version=CACHE_VERSION).items()}
+    if current:
+        result = {pk: value for pk, value in result.items() if pk not in current or _STAMPS[name](value) == current[pk]}
+    missing = [pk for pk in keys.values() if pk not in result]
+    if missing:
+        loaded = load(missing)
+        cache.set_many({_key(name, pk): value for pk, value in loaded.items()}, version=CACHE_VERSION)
+        result.update(loaded)
+    return result
+
+
+def _user_stamp(data):
+    return data['version']
+
+
+def _note_stamp(data):
+    return tuple(data[key] for key in NOTE_VERSION_KEYS)
+
+
+def _subject_stamp(data):
+    return tuple(data[key] for key in SUBJECT_VERSION_KEYS)
+
+
+def _comment_stamp(data):
+    return data['last_updated_at']
+
+
+_STAMPS = {'user': _user_stamp, 'note': _note_stamp, 'subject': _subject_stamp, 'comment': _comment_stamp}
+
+
+def _load_users(pks):
+    return {user.pk: dict(user.to_dict(lite=False), version=user.version) for user in User.objects.filter(pk__in=pks)}
+
+
+def _load_subjects(pks):
+    return {subject.pk: subject.to_dict() for subject in Subject.objects.filter(pk__in=pks)}
+
+
+def _load_notes(pks):
+    # 作者与科目只保存 id, 读取时再组装, 二者修改后无需清理笔记缓存
+    result = {}
+    for note in Note.objects.filter(pk__in=pks).select_related('user', 'subject'):
+        data = note.to_dict(lite=False)
+        data['user'] = note.user_id
+        data['subject'] = note.subject_id
+        result[note.pk] = data
+    return result
+
+
+def _load_comments(pks):
+    result = {}
+    for comment in Comment.objects.filter(pk__in=pks).select_related('user'):
+        data = comment.to_dict(lite=True)
+        data['user'] = comment.user_id
+        data['upp_comment'] = comment.upp_comment_id
+        data['rep_comment'] = comment.rep_comment_id
+        result[comment.pk] = data
+    return result
+
+
+def _lite_user(data):
+    return {key: data[key] for key in USER_LITE_KEYS}
+
+
+def user_dict(pk, lite=True, version=None):
+    # 传入 version 时保证返回的内容不旧于该版本
+    data = _get_many('user', [pk], _load_users, None if version is None else {pk: version}).get(pk)
+    if data is None:
+        return None
+    if lite:
+        return _lite_user(data)
+    data = dict(data)
+    del data['version']
+    return data
+
+
+def note_dict(pk, versions=None):
+    # 与 Note.to_dict(lite=False) 一致; 传入 lookups.get_note_versions 的结果时保证笔记、作者与科目不旧于校验值
+    current = {}
+    if versions is not None:
+        current = {
+            'note': {pk: tuple(getattr(versions, key) for key in NOTE_VERSION_KEYS)},
+            'user': {versions.user_id: versions.user_version},
+            'subject': {versions.subject_id: (versions.subject_updated_at, versions.subject_note_amount)},
+        }
+    data = _get_many('note', [pk], _load_notes, current.get('note')).get(pk)
+    if data is None:
+        return None
+    data['user'] = _lite_user(_get_many('user', [data['user']], _load_users, current.get('user'))[data['user']])
+    data['subject'] = _get_many('subject', [data['subject']], _load_subjects,
+                                current.get('subject'))[data['subject']]
+    return data
+
+
+def comment_dict(pk, versions=None):
+    # 与 Comment.to_dict() 一致; 传入 lookups.get_comment_versions 的结果时保证评论、关联评论与作者不旧于校验值
+    comments, users = {}, {}
+    if versions is not None:
+        related = ((versions.pk, versions.last_updated_at, versions.user_version),
+                   (versions.upp_comment_id, versions.upp_updated_at, versions.upp_user_version),
+                   (versions.rep_comment_id, versions.rep_updated_at, versions.rep_user_version))
+        comments = {comment: updated_at for comment, updated_at, _ in related if comment is not None}
+        users = {comment: version for comment, _, version in related if comment is not None}
+    data = _get_many('comment', [pk], _load_comments, comments).get(pk)
+    if data is None:
+        return None
+    related = _get_many('comment', {pk for pk in (data['upp_comment'], data['rep_comment']) if pk is not None},
+                        _load_comments, comments)
+    related[pk] = data
+    # 评论的作者不会变化, 作者的版本按评论对应
+    users = {related[comment]['user']: version for comment, version in users.items()}
+    users = _get_many('user', {comment['user'] for comment in related.values()}, _load_users, users)
+    for name in ('upp_comment', 'rep_comment'):
+        if data[name] is not None:
+            comment = {key: related[data[name]][key] for key in COMMENT_LITE_KEYS}
+            comment['user'] = _lite_user(users[comment['user']])
+            data[name] = comment
+    data['user'] = _lite_user(users[data['user']])
+    return data
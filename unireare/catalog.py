@@ -0,0 +1,62 @@
+import hashlib
+import threading
+from collections import defaultdict
+
+from django.db.models import Count, Sum
+
+from . import encoding
+from .models import Subject
+
+
+class Catalog:
+    # 科目目录快照: 预先序列化的科目列表与名称子串索引
+    def __init__(self, version, subjects):
+        self.version = version
+        self.subjects = [subject.to_dict() for subject in subjects]
+        self.keys = [(subject.added_at, subject.pk) for subject in subjects]
+        self.encoded = [encoding.dumps(subject).decode() for subject in self.subjects]
+        self.digest = hashlib.md5('\n'.join(self.encoded).encode()).hexdigest()
+        self.last_modified = max((subject.last_updated_at for subject in subjects), default=None)
+        index = defaultdict(list)
+        for position, subject in enumerate(subjects):
+            name = subject.name.lower()
+            for substring in {name[i:j] for i in range(len(name)) for j in range(i + 1, len(name) + 1)}:
+                index[substring].append(position)
+        self.index = dict(index)
+
+    def search(self, name):
+        return self.index.get(name.lower(), [])
+
+    def render(self, positions, extra):
+        # 直接拼接预先序列化的科目, 与 ajax('success', '', {..., 'subjects': [...]}) 输出一致
+        data = encoding.dumps(extra).decode()[:-1]
+        return '{"status": "success", "msg": "", "data": %s%s"subjects": [%s]}}' % (
+            data, ', ' if extra else '', ', '.join(self.encoded[position] for position in positions))
+
+
+_lock = threading.Lock()
+_catalog = None
+
+
+def _current_version():
+    # 科目只会新增或弃用, 每次修改(含 counters 更新笔记数量)都会递增其版本号, 因此 (数量, 版本号之和) 只增不减;
+    # 由数据库得出, 每个进程都能发现其他进程的修改, 不依赖共享缓存
+    version = Subject.objects.aggregate(amount=Count('id'), version=Sum('version'))
+    return version['amount'], version['version']
+
+
+def get():
+    global _catalog
+    version = _current_version()
+    catalog = _catalog
+    if catalog is None or catalog.version != version:
+        with _lock:
+            catalog = Catalog(version, list(Subject.objects.filter(defunct=False).order_by('-added_at', '-id')))
+            _catalog = catalog
+    return catalog
+
+
+def invalidate():
+    # 丢弃本进程的快照, 用于绕过版本号直接改写科目表之后(如 benchmark 生成数据)
+    global _catalog
+    _catalog = None
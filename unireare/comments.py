@@ -0,0 +1,85 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .fieldsets import nested, wants
+from .models import Comment
+from .pagination import cursor_page
+
+comment_ordering = ('added_at', 'id')
+
+
+def _amount(comments):
+    # 相关子查询统计数量, 无匹配时为 0
+    return Coalesce(Subquery(comments.order_by().values('upp_comment').annotate(amount=Count('id')).values('amount'),
+                             output_field=IntegerField()), 0)
+
+
+def _link(comments):
+    # 上级评论与同级回复在内存中关联, 不在当前结果中的补查一次
+    by_id = {comment.pk: comment for comment in comments}
+    missing = {pk for comment in comments for pk in (comment.upp_comment_id, comment.rep_comment_id)
+               if pk is not None and pk not in by_id}
+    if missing:
+        by_id.update((comment.pk, comment) for comment in Comment.objects.filter(pk__in=missing).select_related('user'))
+    for comment in comments:
+        if comment.upp_comment_id is not None:
+            comment.upp_comment = by_id[comment.upp_comment_id]
+        if comment.rep_comment_id is not None:
+            comment.rep_comment = by_id[comment.rep_comment_id]
+
+
+def _linked(fields):
+    return wants(fields, 'upp_comment') or wants(fields, 'rep_comment')
+
+
+def _comments(comments, fields):
+    # 不需要的作者与正文不查询, 需要关联上级评论时它们也可能被输出
+    if wants(fields, 'user') or _linked(fields):
+        comments = comments.select_related('user')
+    if not wants(fields, 'content') and not _linked(fields):
+        comments = comments.defer('content')
+    return comments
+
+
+def thread_page(note, cursor, per_page=10, fields=None):
+    # 一页顶层评论, 每条附带有效回复数与最早的 COMMENT_REPLY_PREVIEW 条回复
+    comments = _comments(Comment.objects.filter(note=note, upp_comment__isnull=True, defunct=False), fields)
+    if wants(fields, 'reply_count'):
+        comments = comments.annotate(reply_count=_amount(Comment.objects.filter(upp_comment=OuterRef('pk'),
+                                                                                defunct=False)))
+    page = cursor_page(comments, comment_ordering, cursor, per_page=per_page)
+    previews = []
+    reply_fields = nested(fields, 'replies')
+    if page.object_list and wants(fields, 'replies'):
+        previews = list(_comments(Comment.objects.filter(upp_comment__in=[comment.pk for comment in page],
+                                                         defunct=False), reply_fields).annotate(
+            rank=_amount(Comment.objects.filter(upp_comment=OuterRef('upp_comment'), defunct=False,
+                                                id__lt=OuterRef('id')))
+        ).filter(rank__lt=settings.COMMENT_REPLY_PREVIEW).order_by('id'))
+    if _linked(fields) or (previews and _linked(reply_fields)):
+        _link(page.object_list + previews)
+    replies = defaultdict(list)
+    for reply in previews:
+        replies[reply.upp_comment_id].append(reply.to_dict(fields=reply_fields))
+    object_list = []
+    for comment in page:
+        data = comment.to_dict(fields=fields)
+        if wants(fields, 'reply_count'):
+            data['reply_count'] = comment.reply_count
+        if wants(fields, 'replies'):
+            data['replies'] = replies[comment.pk]
+        object_list.append(data)
+    page.object_list = object_list
+    return page
+
+
+def reply_page(comment, cursor, per_page=10, fields=None):
+    replies = _comments(Comment.objects.filter(upp_comment=comment, defunct=False), fields)
+    page = cursor_page(replies, comment_ordering, cursor, per_page=per_page)
+    if _linked(fields):
+        _link([comment] + page.object_list)
+    page.object_list = [reply.to_dict(fields=fields) for reply in page]
+    return page
@@ -0,0 +1,36 @@
+import hashlib
+
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+# 私有数据: 共享代理不得保存, 浏览器与客户端可以保存但每次使用前须凭校验值重新验证
+CACHE_CONTROL = 'private, no-cache'
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+class Validators:
+    def __init__(self, *parts, last_modified=None):
+        self.etag = make_etag(*parts)
+        # 与 Last-Modified / If-Modified-Since 相同, 精确到秒; USE_TZ = False 时数据库中为 TIME_ZONE 本地时间
+        if last_modified is not None and timezone.is_naive(last_modified):
+            last_modified = timezone.make_aware(last_modified)
+        self.last_modified = int(last_modified.timestamp()) if last_modified is not None else None
+
+    def not_modified(self, request):
+        # 客户端保存的版本仍然有效时返回 304, 不再查询与序列化响应内容
+        response = get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+        return self.apply(response) if response is not None else None
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified)
+        response['Cache-Control'] = CACHE_CONTROL
+        for header in ('Pragma', 'Expires'):
+            if header in response:
+                del response[header]
+        return response
@@ -0,0 +1,22 @@
+from django.db.models import F
+
+from . import caching
+
+
+def _apply(model, pk, deltas, **conditions):
+    values = {field: F(field) + delta for field, delta in deltas.items()}
+    if any(field.name == 'version' for field in model._meta.concrete_fields):
+        values['version'] = F('version') + 1
+    amount = model.objects.filter(pk=pk, **conditions).update(**values)
+    caching.invalidate(model, pk)
+    return amount
+
+
+def update(model, pk, **deltas):
+    # 单条 UPDATE ... SET x = x + n, 只写计数列, 不触发 auto_now 与 post_save; 带版本号的模型同时递增版本号
+    return _apply(model, pk, deltas)
+
+
+def take(model, pk, field, amount):
+    # UPDATE ... SET x = x - n WHERE x >= n, 余量不足时不修改并返回 0, 无需先加锁读取
+    return _apply(model, pk, {field: -amount}, **{field + '__gte': amount})
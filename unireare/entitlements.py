@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from . import counters
+from .models import Note, Order, Purchased, User
+
+
+class PurchaseError(Exception):
+    pass
+
+
+# 进程内按用户缓存已购买的笔记 id, 保留最近使用的 ENTITLEMENT_CACHE_USERS 个用户;
+# 购买记录不会被删除, 只缓存已购买的结果, 无需跨进程失效, 未购买的笔记每次都查询数据库
+_lock = threading.Lock()
+_known = OrderedDict()
+
+
+def _remember(user_id, pks):
+    with _lock:
+        known = _known.setdefault(user_id, set())
+        known.update(pks)
+        _known.move_to_end(user_id)
+        while len(_known) > settings.ENTITLEMENT_CACHE_USERS:
+            _known.popitem(last=False)
+
+
+def purchased(user, pks):
+    # 返回 pks 中已购买的笔记, 缓存中没有的部分用一次 IN 查询补齐
+    with _lock:
+        known = set()
+        if user.pk in _known:
+            known = _known[user.pk] & set(pks)
+            _known.move_to_end(user.pk)
+    missing = [pk for pk in pks if pk not in known]
+    if missing:
+        found = set(Purchased.objects.filter(user=user, note__in=missing).values_list('note', flat=True))
+        if found:
+            _remember(user.pk, found)
+        known |= found
+    return known
+
+
+def _memo(user):
+    # 保存在 request.user 上, 同一请求内对同一笔记只查询一次, 请求结束后随之丢弃
+    try:
+        return user._purchased
+    except AttributeError:
+        user._purchased = {}
+        return user._purchased
+
+
+def has_purchased(user, note_id):
+    memo = _memo(user)
+    if note_id not in memo:
+        memo[note_id] = note_id in purchased(user, [note_id])
+    return memo[note_id]
+
+
+def _unlocked(user, is_free, author):
+    return is_free or (user.is_authenticated and (user.is_superuser or author == user.pk))
+
+
+def can_access(user, note):
+    # note 需要加载 is_free 与 user_id
+    return _unlocked(user, note.is_free, note.user_id) or has_purchased(user, note.pk)
+
+
+def marks(user, rows):
+    # 当前用户能否阅读这批笔记: {note_id: {'is_accessible': bool}}, rows 需要包含 id, is_free 与 user_id
+    locked = [row.id for row in rows if not _unlocked(user, row.is_free, row.user_id)]
+    bought = purchased(user, locked) if locked and user.is_authenticated else set()
+    return {row.id: {'is_accessible': row.id not in locked or row.id in bought} for row in rows}
+
+
+def _debit(user, note):
+    if not counters.take(User, user.pk, 'balance', note.price):
+        raise PurchaseError('余额不足')
+
+
+def _credit(user, note):
+    counters.update(User, note.user_id, earnings=note.price)
+
+
+def purchase(user, note):
+    # 一个短事务: 先插入 Purchased 占住 (user, note) 唯一键, 再以条件 UPDATE 扣款, 任一步失败整体回滚
+    if note.is_free:
+        raise PurchaseError('该笔记免费')
+    if note.user_id == user.pk:
+        raise PurchaseError('不能购买自己的笔记')
+    try:
+        with transaction.atomic():
+            Purchased.objects.create(user=user, note=note)
+            # 按用户 id 顺序更新买家与作者两行, 两人互相购买时不会死锁
+            for step in (_debit, _credit) if user.pk < note.user_id else (_credit, _debit):
+                step(user, note)
+            counters.update(Note, note.pk, purchase_amount=1)
+            Order.objects.create(user=user, note=note, price=note.price)
+    except IntegrityError:
+        raise PurchaseError('已购买该笔记')
+    _memo(user)[note.pk] = True
+    transaction.on_commit(lambda: _remember(user.pk, [note.pk]))
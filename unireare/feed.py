@@ -0,0 +1,57 @@
+from django.conf import settings
+
+from . import lookups
+from .listing import NoteProjection
+from .models import FeedEntry, Follow, Note
+from .pagination import PER_PAGE, Page, decode_cursor, encode_cursor
+
+# 写扩散: 发布笔记时为每个粉丝写入一条 FeedEntry, 读取时间线只需一次 (user, note) 索引范围扫描
+# 粉丝数不少于 FEED_FANOUT_MAX_FOLLOWERS 的作者不写扩散, 粉丝读取时再合并其笔记(读扩散)
+# 作者粉丝数跌破阈值前以读扩散发布的笔记不会补写到时间线
+
+
+def fans_out(author):
+    return author.follower_amount < settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def fan_out(note):
+    if note.is_draft or not fans_out(note.user):
+        return 0
+    followers = Follow.objects.filter(following=note.user_id).values_list('follower_id', flat=True)
+    entries = [FeedEntry(user_id=follower, note=note, author_id=note.user_id) for follower in followers.iterator()]
+    FeedEntry.objects.bulk_create(entries)
+    return len(entries)
+
+
+def backfill(user, author):
+    # 关注后补入对方最近的笔记
+    if not fans_out(author):
+        return 0
+    notes = Note.objects.filter(user=author, is_draft=False, defunct=False).order_by('-id').values_list('id', flat=True)
+    entries = [FeedEntry(user=user, note_id=note, author=author) for note in notes[:settings.FEED_BACKFILL_SIZE]]
+    FeedEntry.objects.bulk_create(entries)
+    return len(entries)
+
+
+def remove(user, author):
+    return FeedEntry.objects.filter(user=user, author=author).delete()[0]
+
+
+def page(user, cursor, fields=None, per_page=PER_PAGE):
+    # 两路各取 per_page + 1 条按笔记 id 倒序归并, 读扩散一路排除已在时间线中的笔记
+    before = decode_cursor(cursor, Note, ['id'])[0] if cursor else None
+    entries = FeedEntry.objects.filter(user=user, note__defunct=False, note__subject__defunct=False).order_by('-note')
+    celebrities = Follow.objects.filter(follower=user,
+                                        following__follower_amount__gte=settings.FEED_FANOUT_MAX_FOLLOWERS)
+    notes = lookups.visible_notes(user__in=celebrities.values('following'), is_draft=False).exclude(
+        pk__in=FeedEntry.objects.filter(user=user).values('note')).order_by('-id')
+    if before is not None:
+        entries = entries.filter(note__lt=before)
+        notes = notes.filter(pk__lt=before)
+    # 两种投影的列顺序相同, 可共用同一个序列化函数
+    rows = [(row.note__id, row) for row in NoteProjection(fields, prefix='note__').rows(entries)[:per_page + 1]]
+    rows += [(row.id, row) for row in NoteProjection(fields).rows(notes)[:per_page + 1]]
+    # 关注与发布并发时时间线中可能出现重复的笔记, 归并时去重
+    rows = sorted(dict(rows).items(), reverse=True)
+    next_cursor = encode_cursor([rows[per_page - 1][0]]) if len(rows) > per_page else None
+    return Page([row for _, row in rows[:per_page]], {'next_cursor': next_cursor})
@@ -0,0 +1,50 @@
+# ?fields=id,title,user.nickname 解析为 {'id': None, 'title': None, 'user': {'nickname': None}}, None 表示全部字段
+
+
+def _add(fields, path):
+    key, _, rest = path.partition('.')
+    if not rest:
+        fields[key] = None
+    elif key not in fields:
+        fields[key] = _add({}, rest)
+    elif fields[key] is not None:
+        _add(fields[key], rest)
+    return fields
+
+
+def parse(request):
+    value = request.GET.get('fields')
+    if not value:
+        return None
+    fields = {}
+    for path in value.split(','):
+        if path.strip():
+            _add(fields, path.strip())
+    return fields
+
+
+def wants(fields, key):
+    return fields is None or key in fields
+
+
+def nested(fields, key):
+    # 嵌套对象总是保留 id
+    if fields is None or fields.get(key) is None:
+        return None
+    return dict(fields[key], id=None)
+
+
+def prune(data, fields):
+    if fields is None or data is None:
+        return data
+    result = {}
+    for key, value in data.items():
+        if key not in fields:
+            continue
+        sub = nested(fields, key)
+        if sub is not None and isinstance(value, dict):
+            value = prune(value, sub)
+        elif sub is not None and isinstance(value, list):
+            value = [prune(item, sub) if isinstance(item, dict) else item for item in value]
+        result[key] = value
+    return result
@@ -0,0 +1,114 @@
+from django.conf import settings
+from django.db.models.functions import Substr
+
+from .fieldsets import nested, wants
+
+
+def _avatar(name):
+    return settings.MEDIA_URL + (name if name else 'avatars/default.png')
+
+
+# 笔记列表输出字段: (键, 查询列, 转换函数), 与 Note.to_dict(lite=True) 保持一致, 时间在序列化时格式化
+NOTE_FIELDS = (
+    ('id', 'id', None),
+    ('title', 'title', None),
+    ('content', 'excerpt', None),
+    ('is_free', 'is_free', None),
+    ('price', 'price', None),
+    ('is_draft', 'is_draft', None),
+    ('comment_amount', 'comment_amount', None),
+    ('reading_amount', 'reading_amount', None),
+    ('liking_amount', 'liking_amount', None),
+    ('collect_amount', 'collect_amount', None),
+    ('purchase_amount', 'purchase_amount', None),
+    ('added_at', 'added_at', None),
+    ('last_updated_at', 'last_updated_at', None),
+)
+
+# 与 User.to_dict(lite=True) 保持一致
+USER_FIELDS = (
+    ('id', 'user_id', None),
+    ('nickname', 'user__nickname', None),
+    ('school', 'user__school', None),
+    ('major', 'user__major', None),
+    ('motto', 'user__motto', None),
+    ('following_amount', 'user__following_amount', None),
+    ('follower_amount', 'user__follower_amount', None),
+    ('is_vip', 'user__is_vip', None),
+    ('avatar', 'user__avatar', _avatar),
+    ('registered_at', 'user__registered_at', None),
+)
+
+# 与 Subject.to_dict() 保持一致
+SUBJECT_FIELDS = (
+    ('id', 'subject_id', None),
+    ('name', 'subject__name', None),
+    ('note_amount', 'subject__note_amount', None),
+    ('added_at', 'subject__added_at', None),
+    ('last_updated_at', 'subject__last_updated_at', None),
+)
+
+
+def _pick(fields, spec):
+    return fields if spec is None else tuple(field for field in fields if field[0] in spec)
+
+
+def _layout(fields, offset):
+    return tuple((key, offset + index, convert) for index, (key, _, convert) in enumerate(fields))
+
+
+def _build(row, layout):
+    return {key: row[index] if convert is None else convert(row[index]) for key, index, convert in layout}
+
+
+class NoteProjection:
+    # 按 ?fields= 只查询需要的列, 不需要作者或科目时不联表, 不需要摘要时不截取正文
+    # prefix 用于从关联到笔记的模型(如 FeedEntry)中直接查询, 例如 'note__'
+    def __init__(self, fields=None, prefix=''):
+        note = _pick(NOTE_FIELDS, fields)
+        user = _pick(USER_FIELDS, nested(fields, 'user')) if wants(fields, 'user') else ()
+        subject = _pick(SUBJECT_FIELDS, nested(fields, 'subject')) if wants(fields, 'subject') else ()
+        self.prefix = prefix
+        self.columns = tuple(column for _, column, _ in note + user + subject)
+        self.note = _layout(note, 0)
+        self.user = _layout(user, len(note)) if user else None
+        self.subject = _layout(subject, len(note) + len(user)) if subject else None
+
+    def rows(self, notes, extra=()):
+        # 游标分页需要排序列, 即使未请求也一并查询; extra 中的列不加 prefix
+        columns = self.columns + tuple(column for column in ('last_updated_at', 'id') if column not in self.columns)
+        if 'excerpt' in columns:
+            notes = notes.annotate(excerpt=Substr(self.prefix + 'content', 1, 100))
+        columns = tuple(column if column == 'excerpt' else self.prefix + column for column in columns)
+        return notes.values_list(*columns + tuple(column for column in extra if column not in columns), named=True)
+
+    def to_dict(self, row):
+        note = _build(row, self.note)
+        if self.user is not None:
+            note['user'] = _build(row, self.user)
+        if self.subject is not None:
+            note['subject'] = _build(row, self.subject)
+        return note
+
+    def serializer(self, normalizer, marks=None):
+        # 规范化时每个作者与科目只构造一次; marks 为 {笔记 id: 附加字段}, 如当前用户是否已点赞
+        if not normalizer.tables and marks is None:
+            return self.to_dict
+        key = self.prefix + 'id'
+
+        def related(table, row, layout):
+            if not normalizer.tables:
+                return _build(row, layout)
+            return normalizer.ref(table, row[layout[0][1]], lambda: _build(row, layout))
+
+        def serialize(row):
+            note = _build(row, self.note)
+            if self.user is not None:
+                note['user'] = related('users', row, self.user)
+            if self.subject is not None:
+                note['subject'] = related('subjects', row, self.subject)
+            if marks:
+                note.update(marks.get(getattr(row, key), ()))
+            return note
+
+        return serialize
@@ -0,0 +1,79 @@
+from django.db.models import F, OuterRef, Q, Subquery
+
+from .models import Comment, EmailCode, Note, Subject, User
+
+
+# 以下查询均使用 EXISTS 或 LIMIT 1, 最多取回一个对象
+
+def email_registered(email):
+    return User.objects.filter(email=email).exists()
+
+
+def get_user(pk, is_active=True):
+    return User.objects.filter(pk=pk, is_active=is_active).first()
+
+
+def get_active_user(pk):
+    return get_user(pk, is_active=True)
+
+
+def user_exists(pk):
+    return User.objects.filter(pk=pk).exists()
+
+
+def get_email_code(email, code):
+    return EmailCode.objects.filter(email=email, code=code).first()
+
+
+def subject_exists(pk):
+    return Subject.objects.filter(pk=pk).exists()
+
+
+def get_subject(pk):
+    return Subject.objects.filter(pk=pk, defunct=False).first()
+
+
+def visible_notes(**filters):
+    # 笔记及其科目均未弃用
+    return Note.objects.filter(defunct=False, subject__defunct=False, **filters)
+
+
+def get_visible_note(pk, **filters):
+    return visible_notes(pk=pk, **filters).select_related('subject').first()
+
+
+def get_note_versions(pk):
+    # note_view 的校验值: 笔记、作者、科目与评论各自的最后变化, 与可见性检查合为一条查询
+    latest_comment = Comment.objects.filter(note=OuterRef('pk')).order_by('-last_updated_at').values('last_updated_at')
+    return visible_notes(pk=pk).only(
+        'is_free', 'user', 'subject', 'last_updated_at', 'comment_amount', 'liking_amount', 'collect_amount',
+        'purchase_amount'
+    ).annotate(
+        user_version=F('user__version'),
+        subject_updated_at=F('subject__last_updated_at'),
+        subject_note_amount=F('subject__note_amount'),
+        comments_updated_at=Subquery(latest_comment[:1]),
+    ).first()
+
+
+def visible_comments(**filters):
+    # 评论、上级评论、笔记及科目均未弃用
+    return Comment.objects.filter(Q(upp_comment__isnull=True) | Q(upp_comment__defunct=False), defunct=False,
+                                  note__defunct=False, note__subject__defunct=False, **filters)
+
+
+def get_visible_comment(pk, **filters):
+    return visible_comments(pk=pk, **filters).select_related('note').first()
+
+
+def get_comment_versions(pk):
+    # comment_view 的校验值: 评论、上级评论、被回复评论及三者作者各自的最后变化, 与可见性检查合为一条查询
+    return visible_comments(pk=pk).select_related('note').only(
+        'user', 'upp_comment', 'rep_comment', 'last_updated_at', 'note__is_free', 'note__user'
+    ).annotate(
+        user_version=F('user__version'),
+        upp_updated_at=F('upp_comment__last_updated_at'),
+        upp_user_version=F('upp_comment__user__version'),
+        rep_updated_at=F('rep_comment__last_updated_at'),
+        rep_user_version=F('rep_comment__user__version'),
+    ).first()
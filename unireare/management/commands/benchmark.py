@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from unireare import benchmark, buffers
+
+
+class Command(BaseCommand):
+    help = '在临时测试数据库中生成数据集, 逐个请求所有接口并记录查询数、p50/p99 耗时与响应大小, 超出预算时失败'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', default=settings.BENCHMARK_BUDGET, help='预算文件路径')
+        parser.add_argument('--update-budget', action='store_true', help='用本次结果重写预算文件')
+        parser.add_argument('--headroom', type=float, default=2.0, help='重写预算时耗时的放宽倍数')
+        parser.add_argument('--repeat', type=int, default=20, help='每个场景的请求次数')
+        parser.add_argument('--route', action='append', help='只运行指定路由或场景, 可重复')
+        parser.add_argument('--output', help='将结果写入 JSON 文件')
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--subjects', type=int, default=20)
+        parser.add_argument('--notes', type=int, default=3000)
+        parser.add_argument('--comments', type=int, default=15000)
+        parser.add_argument('--follows', type=int, default=20, help='每个用户的平均关注数')
+        parser.add_argument('--messages', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        missing = benchmark.missing_routes()
+        if missing:
+            raise CommandError('以下路由缺少基准场景: %s' % ', '.join(missing))
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # 不发送真实邮件, 上传的文件写入临时目录
+            with tempfile.TemporaryDirectory() as media_root, override_settings(
+                    MEDIA_ROOT=media_root, MAIL_TRANSPORT='unireare.send_mail.LocmemTransport', MAIL_OUTBOX_THREADS=0):
+                self.stdout.write('生成数据集...')
+                fixture = benchmark.seed(options['users'], options['subjects'], options['notes'],
+                                         options['comments'], options['follows'], options['messages'], options['seed'])
+                results = benchmark.run(fixture, options['repeat'], options['route'])
+        finally:
+            # 缓冲中的计数属于临时数据库, 在删除前写回, 不能留到进程退出时写入正式数据库
+            buffers.flush_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write('%-32s %8s %10s %10s %10s' % ('scenario', 'queries', 'p50(ms)', 'p99(ms)', 'bytes'))
+        for name, result in results.items():
+            self.stdout.write('%-32s %8d %10.2f %10.2f %10d' % (
+                name, result['queries'], result['p50_ms'], result['p99_ms'], result['bytes']))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+        if options['update_budget']:
+            budget = {}
+            if options['route'] and os.path.exists(options['budget']):
+                with open(options['budget']) as f:
+                    budget = json.load(f)
+            budget.update(benchmark.make_budget(results, options['headroom']))
+            with open(options['budget'], 'w') as f:
+                json.dump(budget, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write('预算已写入 %s' % options['budget'])
+            return
+        if not os.path.exists(options['budget']):
+            raise CommandError('预算文件 %s 不存在, 可使用 --update-budget 生成' % options['budget'])
+        with open(options['budget']) as f:
+            violations = benchmark.check(results, json.load(f))
+        if violations:
+            raise CommandError('超出预算:\n' + '\n'.join(violations))
+        self.stdout.write(self.style.SUCCESS('全部场景均在预算内'))
@@ -0,0 +1,52 @@
+import datetime
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from unireare import encoding
+from unireare.models import Note, Subject, User
+
+
+def note_list_payload(size):
+    # 与 note_list 响应相同结构的数据, 不访问数据库
+    now = datetime.datetime.now()
+    users = [User(pk=i, nickname='用户%d' % i, school='大学', major='专业', registered_at=now) for i in range(3)]
+    subject = Subject(pk=1, name='线性代数', note_amount=size, added_at=now, last_updated_at=now)
+    notes = [Note(pk=i, user=users[i % 3], subject=subject, title='线性代数期末复习笔记 %d' % i,
+                  content='矩阵的秩与线性方程组的解，' * 10, is_free=i % 2 == 0, price=None if i % 2 == 0 else 5,
+                  comment_amount=i, reading_amount=i * 10, added_at=now, last_updated_at=now)
+             for i in range(size)]
+    return {'status': 'success', 'msg': '', 'data': {'notes': [note.to_dict() for note in notes], 'next_cursor': None}}
+
+
+def _formatted(value):
+    # 旧实现: to_dict 中逐个 strftime, 再交给 JsonResponse 的标准库编码器
+    if isinstance(value, dict):
+        return {key: _formatted(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_formatted(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return value.strftime(encoding.DATETIME_FORMAT)
+    return value
+
+
+class Command(BaseCommand):
+    help = '比较 note_list 响应在各 JSON 序列化实现下的耗时与大小'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100, help='笔记数量')
+        parser.add_argument('--number', type=int, default=200, help='每轮序列化次数')
+
+    def handle(self, *args, **options):
+        payload = note_list_payload(options['size'])
+        paths = [('legacy', lambda: json.dumps(_formatted(payload), cls=DjangoJSONEncoder).encode())]
+        paths += [(name, lambda dumps=dumps: dumps(payload)) for name, dumps in sorted(encoding.BACKENDS.items())]
+        baseline = None
+        self.stdout.write('%-10s %12s %10s %8s' % ('backend', 'us/op', 'bytes', 'speedup'))
+        for name, dumps in paths:
+            seconds = min(timeit.repeat(dumps, number=options['number'], repeat=5)) / options['number']
+            baseline = baseline or seconds
+            self.stdout.write('%-10s %12.1f %10d %7.1fx' % (name, seconds * 1e6, len(dumps()), baseline / seconds))
+        self.stdout.write('当前使用: %s' % encoding.backend())
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from unireare import trending
+
+
+class Command(BaseCommand):
+    help = '计算全站与各科目的热门笔记排行, 默认每隔 interval 秒重新计算一次'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='计算一次后退出')
+        parser.add_argument('--interval', type=float, default=300.0)
+        parser.add_argument('--top', type=int, help='每个排行保留的笔记数量, 默认为 TRENDING_TOP_K')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            amount = trending.compute(options['top'])
+            self.stdout.write('已写入 %d 条排行记录, 耗时 %.2f 秒 (%s)' % (
+                amount, time.perf_counter() - started, 'numpy' if trending.numpy is not None else 'python'))
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from unireare.outbox import process_outbox
+
+
+class Command(BaseCommand):
+    help = '发送待发邮件, 失败的邮件按指数退避重试'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='处理一轮后退出')
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument('--limit', type=int, default=100)
+
+    def handle(self, *args, **options):
+        while True:
+            sent = process_outbox(options['limit'])
+            if sent:
+                self.stdout.write('已发送 %d 封邮件' % sent)
+            if options['once']:
+                return
+            if not sent:
+                time.sleep(options['interval'])
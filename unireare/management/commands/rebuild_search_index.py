@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from unireare.models import Note, NoteToken
+from unireare.search import note_tokens
+
+
+class Command(BaseCommand):
+    help = '重建笔记全文搜索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        amount = 0
+        with transaction.atomic():
+            NoteToken.objects.all().delete()
+            tokens = []
+            for note in Note.objects.filter(defunct=False).only('id', 'title', 'content').iterator():
+                tokens.extend(note_tokens(note))
+                if len(tokens) >= batch_size:
+                    NoteToken.objects.bulk_create(tokens)
+                    tokens = []
+                amount += 1
+            NoteToken.objects.bulk_create(tokens)
+        self.stdout.write('已重建 %d 篇笔记的索引' % amount)
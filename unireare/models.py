@@ -4,8 +4,10 @@ from uuid import uuid4
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.db import models
+from django.utils import timezone
 from django.utils.deconstruct import deconstructible
 
+from .fieldsets import nested, prune, wants
 from .managers import UserManager
 
 
@@ -23,8 +25,30 @@ class PathAndRename(object):
         return os.path.join(self.path, filename)
 
 
+class VersionedModel(models.Model):
+    # 内容每次变化时递增版本号, 作为条件请求的校验值; counters 中的计数更新同样会递增
+    version = models.PositiveIntegerField('版本', default=0)
+
+    # 只修改这些字段时不递增版本号
+    unversioned_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or update_fields is not None and set(update_fields) <= set(self.unversioned_fields):
+            return super().save(*args, **kwargs)
+        # 在数据库中递增, 与并发的 F() 计数更新交错时也不会重复使用同一版本号
+        self.version = models.F('version') + 1
+        if update_fields is not None:
+            kwargs['update_fields'] = list(update_fields) + ['version']
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
+
 # 用户
-class User(AbstractBaseUser, PermissionsMixin):
+class User(VersionedModel, AbstractBaseUser, PermissionsMixin):
     email = models.EmailField('邮箱', unique=True)
     nickname = models.CharField('昵称', max_length=16)
     school = models.CharField('学校', max_length=16)
@@ -45,6 +69,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
+    # 登录时只更新 last_login
+    unversioned_fields = ('last_login',)
+
     class Meta:
         verbose_name = '用户'
         verbose_name_plural = '用户'
@@ -55,9 +82,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     def get_short_name(self):
         return self.nickname
 
-    def to_dict(self, lite=True):
+    def to_dict(self, lite=True, fields=None):
         if lite:
-            return {
+            return prune({
                 'id': self.pk,
                 'nickname': self.nickname,
                 'school': self.school,
@@ -67,9 +94,9 @@ class User(AbstractBaseUser, PermissionsMixin):
                 'follower_amount': self.follower_amount,
                 'is_vip': self.is_vip,
                 'avatar': settings.MEDIA_URL + (self.avatar.name if self.avatar.name else 'avatars/default.png'),
-                'registered_at': self.registered_at.strftime("%Y-%m-%d %H:%M:%S")
-            }
-        return {
+                'registered_at': self.registered_at
+            }, fields)
+        return prune({
             'id': self.pk,
             'email': self.email,
             'nickname': self.nickname,
@@ -84,8 +111,8 @@ class User(AbstractBaseUser, PermissionsMixin):
             'is_vip': self.is_vip,
             'is_superuser': self.is_superuser,
             'avatar': settings.MEDIA_URL + (self.avatar.name if self.avatar.name else 'avatars/default.png'),
-            'registered_at': self.registered_at.strftime("%Y-%m-%d %H:%M:%S")
-        }
+            'registered_at': self.registered_at
+        }, fields)
 
 
 # 邮箱验证码
@@ -95,6 +122,24 @@ class EmailCode(models.Model):
     created_at = models.DateTimeField('生成时间', auto_now=True)
 
 
+# 待发邮件
+class MailOutbox(models.Model):
+    email = models.EmailField('收件人')
+    subject = models.CharField('主题', max_length=128)
+    content = models.TextField('内容')
+    is_sent = models.BooleanField('是否已发送', default=False)
+    attempts = models.IntegerField('尝试次数', default=0)
+    next_attempt_at = models.DateTimeField('下次尝试时间', default=timezone.now)
+    last_error = models.TextField('最近错误', blank=True)
+    added_at = models.DateTimeField('添加时间', auto_now_add=True)
+    sent_at = models.DateTimeField('发送时间', null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_sent', 'next_attempt_at']),
+        ]
+
+
 # 图片
 class Image(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -110,21 +155,26 @@ class Message(models.Model):
     is_read = models.BooleanField('是否已读', default=False)
     sended_at = models.DateTimeField('关注时间', auto_now_add=True)
 
-    def to_dict(self, lite=True):
+    class Meta:
+        indexes = [
+            models.Index(fields=['to_user', 'sended_at', 'id']),
+        ]
+
+    def to_dict(self, lite=True, fields=None):
         if lite:
-            return {
+            return prune({
                 'id': self.id,
-                'user': self.from_user.to_dict(),
+                'user': self.from_user.to_dict(fields=nested(fields, 'user')) if wants(fields, 'user') else None,
                 'is_read': self.is_read,
-                'sended_at': self.sended_at.strftime("%Y-%m-%d %H:%M:%S")
-            }
-        return {
+                'sended_at': self.sended_at
+            }, fields)
+        return prune({
             'id': self.id,
-            'user': self.from_user.to_dict(),
-            'content': self.content,
+            'user': self.from_user.to_dict(fields=nested(fields, 'user')) if wants(fields, 'user') else None,
+            'content': self.content if wants(fields, 'content') else None,
             'is_read': self.is_read,
-            'sended_at': self.sended_at.strftime("%Y-%m-%d %H:%M:%S")
-        }
+            'sended_at': self.sended_at
+        }, fields)
 
 
 # 关注
@@ -133,23 +183,35 @@ class Follow(models.Model):
     following = models.ForeignKey(User, related_name='following', on_delete=models.CASCADE)
     followed_at = models.DateTimeField('关注时间', auto_now_add=True)
 
+    class Meta:
+        unique_together = ('follower', 'following')
+        indexes = [
+            models.Index(fields=['follower', 'followed_at', 'id']),
+            models.Index(fields=['following', 'followed_at', 'id']),
+        ]
+
 
 # 科目
-class Subject(models.Model):
+class Subject(VersionedModel):
     name = models.CharField('科目名称', max_length=16)
     note_amount = models.IntegerField('笔记数量', default=0)
     added_at = models.DateTimeField('添加时间', auto_now_add=True)
     last_updated_at = models.DateTimeField('最后更新时间', auto_now=True)
     defunct = models.BooleanField('已弃用', default=False)
 
-    def to_dict(self):
-        return {
+    class Meta:
+        indexes = [
+            models.Index(fields=['added_at', 'id']),
+        ]
+
+    def to_dict(self, fields=None):
+        return prune({
             'id': self.id,
             'name': self.name,
             'note_amount': self.note_amount,
-            'added_at': self.added_at.strftime("%Y-%m-%d %H:%M:%S"),
-            'last_updated_at': self.last_updated_at.strftime("%Y-%m-%d %H:%M:%S")
-        }
+            'added_at': self.added_at,
+            'last_updated_at': self.last_updated_at
+        }, fields)
 
 
 # 笔记
@@ -170,14 +232,21 @@ class Note(models.Model):
     last_updated_at = models.DateTimeField('最后更新时间', auto_now=True)
     defunct = models.BooleanField('已弃用', default=False)
 
-    def to_dict(self, lite=True):
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_draft', 'defunct', 'last_updated_at', 'id']),
+            models.Index(fields=['subject', 'is_draft', 'defunct', 'last_updated_at', 'id']),
+            models.Index(fields=['user', 'is_draft', 'defunct', 'last_updated_at', 'id']),
+        ]
+
+    def to_dict(self, lite=True, fields=None):
         if lite:
-            return {
+            return prune({
                 'id': self.id,
-                'user': self.user.to_dict(),
-                'subject': self.subject.to_dict(),
+                'user': self.user.to_dict(fields=nested(fields, 'user')) if wants(fields, 'user') else None,
+                'subject': self.subject.to_dict(fields=nested(fields, 'subject')) if wants(fields, 'subject') else None,
                 'title': self.title,
-                'content': self.content[:100],
+                'content': self.content[:100] if wants(fields, 'content') else None,
                 'is_free': self.is_free,
                 'price': self.price,
                 'is_draft': self.is_draft,
@@ -186,15 +255,15 @@ class Note(models.Model):
                 'liking_amount': self.liking_amount,
                 'collect_amount': self.collect_amount,
                 'purchase_amount': self.purchase_amount,
-                'added_at': self.added_at.strftime("%Y-%m-%d %H:%M:%S"),
-                'last_updated_at': self.last_updated_at.strftime("%Y-%m-%d %H:%M:%S")
-            }
-        return {
+                'added_at': self.added_at,
+                'last_updated_at': self.last_updated_at
+            }, fields)
+        return prune({
             'id': self.id,
-            'user': self.user.to_dict(),
-            'subject': self.subject.to_dict(),
+            'user': self.user.to_dict(fields=nested(fields, 'user')) if wants(fields, 'user') else None,
+            'subject': self.subject.to_dict(fields=nested(fields, 'subject')) if wants(fields, 'subject') else None,
             'title': self.title,
-            'content': self.content,
+            'content': self.content if wants(fields, 'content') else None,
             'is_free': self.is_free,
             'price': self.price,
             'is_draft': self.is_draft,
@@ -203,9 +272,33 @@ class Note(models.Model):
             'liking_amount': self.liking_amount,
             'collect_amount': self.collect_amount,
             'purchase_amount': self.purchase_amount,
-            'added_at': self.added_at.strftime("%Y-%m-%d %H:%M:%S"),
-            'last_updated_at': self.last_updated_at.strftime("%Y-%m-%d %H:%M:%S")
-        }
+            'added_at': self.added_at,
+            'last_updated_at': self.last_updated_at
+        }, fields)
+
+
+# 笔记搜索索引
+class NoteToken(models.Model):
+    note = models.ForeignKey(Note, on_delete=models.CASCADE)
+    token = models.CharField('词元', max_length=32)
+    in_title = models.BooleanField('出现在标题', default=False)
+    weight = models.IntegerField('权重', default=0)
+
+    class Meta:
+        unique_together = ('token', 'note')
+
+
+# 关注动态时间线: 发布笔记时写入每个粉丝的时间线, 按笔记 id 倒序读取
+class FeedEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    note = models.ForeignKey(Note, on_delete=models.CASCADE)
+    author = models.ForeignKey(User, related_name='feed_author', on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'note']),
+            models.Index(fields=['user', 'author']),
+        ]
 
 
 # 评论
@@ -219,26 +312,61 @@ class Comment(models.Model):
     last_updated_at = models.DateTimeField('最后更新时间', auto_now=True)
     defunct = models.BooleanField('已弃用', default=False)
 
-    def to_dict(self, lite=False):
+    class Meta:
+        indexes = [
+            models.Index(fields=['note', 'upp_comment', 'defunct', 'added_at', 'id']),
+            models.Index(fields=['upp_comment', 'defunct', 'added_at', 'id']),
+        ]
+
+    def _related_dict(self, name, fields):
+        comment = getattr(self, name) if wants(fields, name) else None
+        return comment.to_dict(lite=True, fields=nested(fields, name)) if comment else None
+
+    def to_dict(self, lite=False, fields=None):
         if lite:
-            return {
+            return prune({
                 'id': self.id,
-                'user': self.user.to_dict(),
-                'note': self.note.id,
-                'content': self.content,
-                'add_at': self.added_at.strftime("%Y-%m-%d %H:%M:%S"),
-                'last_updated_at': self.last_updated_at.strftime("%Y-%m-%d %H:%M:%S")
-            }
-        return {
+                'user': self.user.to_dict(fields=nested(fields, 'user')) if wants(fields, 'user') else None,
+                'note': self.note_id,
+                'content': self.content if wants(fields, 'content') else None,
+                'add_at': self.added_at,
+                'last_updated_at': self.last_updated_at
+            }, fields)
+        return prune({
             'id': self.id,
-            'user': self.user.to_dict(),
-            'note': self.note.id,
-            'upp_comment': self.upp_comment.to_dict(lite=True) if self.upp_comment else None,
-            'rep_comment': self.rep_comment.to_dict(lite=True) if self.rep_comment else None,
-            'content': self.content,
-            'add_at': self.added_at.strftime("%Y-%m-%d %H:%M:%S"),
-            'last_updated_at': self.last_updated_at.strftime("%Y-%m-%d %H:%M:%S")
-        }
+            'user': self.user.to_dict(fields=nested(fields, 'user')) if wants(fields, 'user') else None,
+            'note': self.note_id,
+            'upp_comment': self._related_dict('upp_comment', fields),
+            'rep_comment': self._related_dict('rep_comment', fields),
+            'content': self.content if wants(fields, 'content') else None,
+            'add_at': self.added_at,
+            'last_updated_at': self.last_updated_at
+        }, fields)
+
+
+# 热门笔记排行: 由 compute_trending 定期计算, payload 为预先序列化的笔记
+class TrendingNote(models.Model):
+    subject = models.ForeignKey(Subject, null=True, on_delete=models.CASCADE)  # 为空表示全站排行
+    rank = models.PositiveIntegerField('名次')
+    note = models.ForeignKey(Note, on_delete=models.CASCADE)
+    score = models.FloatField('热度')
+    payload = models.TextField('笔记')
+    computed_at = models.DateTimeField('计算时间')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['subject', 'rank']),
+        ]
+
+
+# 点赞
+class Like(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    note = models.ForeignKey(Note, on_delete=models.CASCADE)
+    liked_at = models.DateTimeField('点赞时间', auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'note')
 
 
 # 收藏
@@ -247,11 +375,18 @@ class Collection(models.Model):
     note = models.ForeignKey(Note, on_delete=models.CASCADE)
     collected_at = models.DateTimeField('收藏时间', auto_now_add=True)
 
+    class Meta:
+        unique_together = ('user', 'note')
+        indexes = [
+            models.Index(fields=['user', 'collected_at', 'id']),
+        ]
+
 
 # 订单
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     note = models.ForeignKey(Note, on_delete=models.CASCADE)
+    price = models.IntegerField('价格', default=0)
     added_at = models.DateTimeField('添加时间', auto_now_add=True)
 
 
@@ -261,6 +396,9 @@ class Purchased(models.Model):
     note = models.ForeignKey(Note, on_delete=models.CASCADE)
     purchased_at = models.DateTimeField('购买时间', auto_now_add=True)
 
+    class Meta:
+        unique_together = ('user', 'note')
+
 
 # 公告
 class Announcement(models.Model):
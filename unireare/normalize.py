@@ -0,0 +1,35 @@
+class Normalizer:
+    # ?normalize=1 时嵌套的用户与科目只在 users / subjects 表中输出一次, 行内以 id 引用
+    fields = {'user': 'users', 'subject': 'subjects'}
+
+    def __init__(self, *tables):
+        self.tables = {table: {} for table in tables}
+
+    def ref(self, table, pk, build):
+        entities = self.tables[table]
+        if pk not in entities:
+            entities[pk] = build()
+        return pk
+
+    def __call__(self, item):
+        if not self.tables:
+            return item
+        if isinstance(item, list):
+            return [self(value) for value in item]
+        if not isinstance(item, dict):
+            return item
+        result = {}
+        for key, value in item.items():
+            table = self.fields.get(key)
+            if table in self.tables and isinstance(value, dict):
+                result[key] = self.ref(table, value['id'], lambda: value)
+            else:
+                result[key] = self(value)
+        return result
+
+
+def from_request(request, *tables):
+    # 未要求时返回不做任何处理的 Normalizer
+    if request.GET.get('normalize'):
+        return Normalizer(*tables)
+    return Normalizer()
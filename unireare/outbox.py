@@ -0,0 +1,106 @@
+import datetime
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import MailOutbox
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+_transport = None
+
+
+def get_transport():
+    global _transport
+    if _transport is None:
+        _transport = import_string(settings.MAIL_TRANSPORT)()
+    return _transport
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.MAIL_OUTBOX_THREADS,
+                                           thread_name_prefix='unireare-mail')
+            # 失败的邮件到期后由线程池重试, 也接手此前退出的进程未发出的邮件
+            threading.Thread(target=_poll, name='unireare-mail-retry', daemon=True).start()
+        return _executor
+
+
+def enqueue(email, subject, content):
+    # 只写入待发邮件, MAIL_OUTBOX_THREADS 不为 0 时由进程内的线程池发送并重试, 否则由 mail_worker 命令发送
+    mail = MailOutbox.objects.create(email=email, subject=subject, content=content)
+    if settings.MAIL_OUTBOX_THREADS:
+        transaction.on_commit(lambda: _get_executor().submit(_deliver_in_thread, mail.pk))
+    return mail
+
+
+def _deliver_in_thread(pk):
+    try:
+        deliver(pk)
+    except Exception:
+        logger.exception('邮件 %s 发送失败', pk)
+    finally:
+        connections.close_all()
+
+
+def _poll():
+    while True:
+        time.sleep(settings.MAIL_RETRY_POLL_INTERVAL)
+        try:
+            pks = _due(100)
+        except Exception:
+            logger.exception('查询待发邮件失败')
+            continue
+        finally:
+            connections.close_all()
+        for pk in pks:
+            _executor.submit(_deliver_in_thread, pk)
+
+
+def _backoff(attempts):
+    return datetime.timedelta(seconds=settings.MAIL_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+
+
+def deliver(pk):
+    now = timezone.now()
+    # 先把下次尝试时间推后作为租约, 防止多个发送者重复发送
+    claimed = MailOutbox.objects.filter(pk=pk, is_sent=False, attempts__lt=settings.MAIL_MAX_ATTEMPTS,
+                                        next_attempt_at__lte=now).update(
+        next_attempt_at=now + datetime.timedelta(seconds=settings.MAIL_SEND_TIMEOUT * 2))
+    if not claimed:
+        return False
+    mail = MailOutbox.objects.get(pk=pk)
+    try:
+        get_transport().send(mail.email, mail.subject, mail.content)
+    except Exception as e:
+        mail.attempts += 1
+        mail.next_attempt_at = timezone.now() + _backoff(mail.attempts)
+        mail.last_error = repr(e)
+        mail.save(update_fields=['attempts', 'next_attempt_at', 'last_error'])
+        logger.warning('邮件 %s 第 %d 次发送失败: %r', pk, mail.attempts, e)
+        return False
+    mail.attempts += 1
+    mail.is_sent = True
+    mail.sent_at = timezone.now()
+    mail.save(update_fields=['attempts', 'is_sent', 'sent_at'])
+    return True
+
+
+def _due(limit):
+    return list(MailOutbox.objects.filter(
+        is_sent=False, attempts__lt=settings.MAIL_MAX_ATTEMPTS, next_attempt_at__lte=timezone.now()
+    ).order_by('next_attempt_at').values_list('pk', flat=True)[:limit])
+
+
+def process_outbox(limit=100):
+    return sum(1 for pk in _due(limit) if deliver(pk))
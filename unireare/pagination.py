@@ -0,0 +1,162 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+PER_PAGE = 10
+
+
+class PageError(Exception):
+    pass
+
+
+class Page:
+    def __init__(self, object_list, extra=None):
+        self.object_list = object_list
+        self.extra = extra if extra is not None else {}
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor, model, fields):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeError, ValueError):
+        raise PageError('游标格式错误')
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise PageError('游标格式错误')
+    result = []
+    for name, value in zip(fields, values):
+        # 游标由客户端传回, 只接受 encode_cursor 生成的标量, 整数不超出数据库的 64 位整数范围
+        if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+            raise PageError('游标格式错误')
+        try:
+            value = model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            pass
+        except (ValidationError, TypeError, ValueError, OverflowError):
+            raise PageError('游标格式错误')
+        if isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63:
+            raise PageError('游标格式错误')
+        if value is None:
+            raise PageError('游标格式错误')
+        result.append(value)
+    return result
+
+
+def keyset_filter(ordering, values):
+    # (a, b) < (x, y) 展开为 a < x OR (a = x AND b < y)
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = '%s__%s' % (name, 'lt' if field.startswith('-') else 'gt')
+        branch = Q(**{lookup: values[i]})
+        for prev, value in zip(ordering[:i], values[:i]):
+            branch &= Q(**{prev.lstrip('-'): value})
+        condition |= branch
+    return condition
+
+
+def cursor_key(item, fields):
+    return [getattr(item, name) for name in fields]
+
+
+def _fetch(rows, ordering, values, size):
+    if values is not None:
+        rows = rows.filter(keyset_filter(ordering, values))
+    object_list = list(rows[:size + 1])
+    if len(object_list) > size:
+        object_list = object_list[:size]
+        return object_list, cursor_key(object_list[-1], [field.lstrip('-') for field in ordering])
+    return object_list, None
+
+
+def iterate_pages(queryset, ordering, project=None, size=None):
+    # 按游标分批读取, 内存占用与结果集大小无关
+    size = size or settings.LIST_STREAM_CHUNK_SIZE
+    queryset = queryset.order_by(*ordering)
+    rows = project(queryset) if project is not None else queryset
+    values = None
+    while True:
+        object_list, values = _fetch(rows, ordering, values, size)
+        if object_list:
+            yield object_list
+        if values is None:
+            return
+
+
+def cursor_page(queryset, ordering, cursor, project=None, per_page=PER_PAGE):
+    # ordering 的最后一个字段必须唯一(通常为 id), 以保证游标位置确定
+    queryset = queryset.order_by(*ordering)
+    rows = project(queryset) if project is not None else queryset
+    values = None
+    if cursor:
+        values = decode_cursor(cursor, queryset.model, [field.lstrip('-') for field in ordering])
+    object_list, next_values = _fetch(rows, ordering, values, per_page)
+    return Page(object_list, {'next_cursor': encode_cursor(next_values) if next_values is not None else None})
+
+
+def paginate(request, queryset, ordering, project=None, per_page=PER_PAGE):
+    if 'cursor' in request.GET:
+        page = cursor_page(queryset, ordering, request.GET.get('cursor'), project, per_page)
+        if request.GET.get('count'):
+            page.extra['count'] = queryset.count()
+        return page
+    if request.GET.get('page'):
+        try:
+            page = int(request.GET.get('page'))
+        except (TypeError, ValueError):
+            raise PageError('页码格式错误')
+        queryset = queryset.order_by(*ordering)
+        paginator = Paginator(project(queryset) if project is not None else queryset, per_page)
+        if page not in range(1, paginator.num_pages + 1):
+            raise PageError('页码范围错误')
+        return Page(paginator.get_page(page), {
+            'page': page,
+            'num_pages': paginator.num_pages,
+        })
+    # 未分页时最多返回 LIST_MAX_SIZE 条, 其余通过 next_cursor 继续获取
+    return cursor_page(queryset, ordering, None, project, settings.LIST_MAX_SIZE)
+
+
+def _slice(object_list, keys, start, size):
+    end = start + size
+    next_cursor = encode_cursor(keys[end - 1]) if end < len(object_list) else None
+    return Page(object_list[start:end], {'next_cursor': next_cursor})
+
+
+def paginate_list(request, object_list, keys, model, fields, per_page=PER_PAGE):
+    # 内存列表分页, object_list 已按 keys 降序排列, 参数与 paginate 一致
+    if 'cursor' in request.GET:
+        start = 0
+        if request.GET.get('cursor'):
+            values = tuple(decode_cursor(request.GET.get('cursor'), model, fields))
+            start = next((i for i, key in enumerate(keys) if key < values), len(keys))
+        page = _slice(object_list, keys, start, per_page)
+        if request.GET.get('count'):
+            page.extra['count'] = len(object_list)
+        return page
+    if request.GET.get('page'):
+        try:
+            page = int(request.GET.get('page'))
+        except (TypeError, ValueError):
+            raise PageError('页码格式错误')
+        paginator = Paginator(object_list, per_page)
+        if page not in range(1, paginator.num_pages + 1):
+            raise PageError('页码范围错误')
+        return Page(paginator.get_page(page), {
+            'page': page,
+            'num_pages': paginator.num_pages,
+        })
+    return _slice(object_list, keys, 0, settings.LIST_MAX_SIZE)
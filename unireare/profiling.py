@@ -0,0 +1,180 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# 直方图桶上界(毫秒)
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_local = threading.local()
+_lock = threading.Lock()
+
+
+class Profile:
+    # 一次采样请求的计时, 同时作为数据库 execute_wrapper 统计 SQL 数量与耗时
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.timings = defaultdict(float)
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.timings['db'] += time.perf_counter() - start
+
+    def server_timing(self, total):
+        app = total - self.timings['db'] - self.timings['json']
+        return 'total;dur=%.2f, app;dur=%.2f, db;dur=%.2f;desc="%d queries", json;dur=%.2f' % (
+            total * 1000, app * 1000, self.timings['db'] * 1000, self.queries, self.timings['json'] * 1000)
+
+
+@contextmanager
+def timer(name):
+    # 未被采样时不做任何计时
+    profile = getattr(_local, 'profile', None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.timings[name] += time.perf_counter() - start
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        index = 0
+        while index < len(BUCKETS) and value > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # 返回包含该分位数的桶的上界
+        rank = q * sum(self.counts)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else round(self.max, 2)
+        return 0
+
+    def to_dict(self):
+        amount = sum(self.counts)
+        return {
+            'avg': round(self.total / amount, 2) if amount else 0,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 2),
+            'buckets': dict(zip([str(bucket) for bucket in BUCKETS] + ['inf'], self.counts)),
+        }
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.wall = Histogram()
+        self.db = Histogram()
+        self.json = Histogram()
+        self.queries = 0
+        self.bytes = 0
+
+    def add(self, record):
+        self.requests += 1
+        self.wall.add(record['wall_ms'])
+        self.db.add(record['db_ms'])
+        self.json.add(record['json_ms'])
+        self.queries += record['queries']
+        self.bytes += record['bytes'] or 0
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'wall_ms': self.wall.to_dict(),
+            'db_ms': self.db.to_dict(),
+            'json_ms': self.json.to_dict(),
+            'avg_queries': round(self.queries / self.requests, 2),
+            'avg_bytes': self.bytes // self.requests,
+        }
+
+
+_stats = defaultdict(ViewStats)
+
+
+def record(data):
+    with _lock:
+        _stats[data['view']].add(data)
+
+
+def snapshot():
+    with _lock:
+        return {view: stats.to_dict() for view, stats in sorted(_stats.items())}
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+class ProfilingMiddleware:
+    # 按 PROFILING_SAMPLE_RATE 采样请求, 记录总耗时、SQL 数量与耗时、ajax() 序列化耗时与响应大小
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if settings.PROFILING_LOG_FILE and not logger.handlers:
+            handler = RotatingFileHandler(settings.PROFILING_LOG_FILE, maxBytes=settings.PROFILING_LOG_MAX_BYTES,
+                                          backupCount=settings.PROFILING_LOG_BACKUP_COUNT)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+
+    def __call__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profile = Profile()
+        _local.profile = profile
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _local.profile = None
+        total = time.perf_counter() - profile.start
+        response['Server-Timing'] = profile.server_timing(total)
+        match = getattr(request, 'resolver_match', None)
+        data = {
+            'view': match.view_name if match else 'unresolved',
+            'method': request.method,
+            'status': response.status_code,
+            'wall_ms': round(total * 1000, 2),
+            'db_ms': round(profile.timings['db'] * 1000, 2),
+            'json_ms': round(profile.timings['json'] * 1000, 2),
+            'queries': profile.queries,
+            # 流式响应在中间件返回后才生成内容, 无法统计大小
+            'bytes': None if response.streaming else len(response.content),
+        }
+        record(data)
+        if settings.PROFILING_LOG_FILE:
+            logger.info(json.dumps(data))
+        return response
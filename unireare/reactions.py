@@ -0,0 +1,50 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+
+from .buffers import collect_counter, liking_counter
+from .fieldsets import wants
+from .models import Collection, Like, Note
+
+# 输出键, 成员关系模型, 计数缓冲
+KINDS = {
+    'is_liked': (Like, liking_counter),
+    'is_collected': (Collection, collect_counter),
+}
+
+
+def add(kind, user, note):
+    # 唯一约束保证重复操作不会重复计数
+    model, counter = KINDS[kind]
+    try:
+        with transaction.atomic():
+            model.objects.create(user=user, note=note)
+    except IntegrityError:
+        return False
+    counter.add(note.pk)
+    return True
+
+
+def remove(kind, user, note_id):
+    model, counter = KINDS[kind]
+    deleted, _ = model.objects.filter(user=user, note=note_id).delete()
+    if deleted:
+        counter.add(note_id, -deleted)
+    return bool(deleted)
+
+
+def pending(note_id):
+    # 尚未写回数据库的点赞与收藏增量
+    return {'liking_amount': liking_counter.pending(note_id), 'collect_amount': collect_counter.pending(note_id)}
+
+
+def marks(user, pks, fields=None):
+    # 当前用户是否已点赞/收藏这些笔记, 一次查询: {note_id: {'is_liked': bool, 'is_collected': bool}}
+    kinds = [kind for kind in KINDS if wants(fields, kind)]
+    if not pks or not kinds:
+        return {}
+    if not user.is_authenticated:
+        return {pk: {kind: False for kind in kinds} for pk in pks}
+    notes = Note.objects.filter(pk__in=pks).annotate(**{
+        kind: Exists(KINDS[kind][0].objects.filter(user=user, note=OuterRef('pk'))) for kind in kinds
+    })
+    return {row[0]: dict(zip(kinds, row[1:])) for row in notes.values_list('pk', *kinds)}
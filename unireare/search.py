@@ -0,0 +1,106 @@
+import re
+from collections import Counter
+
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum, Value
+
+from .models import NoteToken
+
+TITLE_WEIGHT = 10
+
+TOKEN_MAX_LENGTH = 32
+
+_TOKEN_RE = re.compile(r'[0-9a-z]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+ranked_ordering = ('-search_score', '-last_updated_at', '-id')
+
+
+def _is_cjk(run):
+    return run[0] >= '\u3400'
+
+
+def tokenize(text):
+    # 中文按单字与相邻二字切分, 字母数字按单词切分
+    tokens = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if _is_cjk(run):
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run[:TOKEN_MAX_LENGTH])
+    return tokens
+
+
+def query_terms(query):
+    # 返回 (中文词元, 字母数字前缀): 字母数字词在索引中按整词保存, 查询时按前缀匹配, 输入到一半的词也能命中
+    terms, prefixes = set(), set()
+    for run in _TOKEN_RE.findall(query.lower()):
+        if not _is_cjk(run):
+            prefixes.add(run[:TOKEN_MAX_LENGTH])
+        elif len(run) > 1:
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.add(run)
+    return terms, prefixes
+
+
+def note_tokens(note):
+    title_tokens = Counter(tokenize(note.title))
+    content_tokens = Counter(tokenize(note.content))
+    return [
+        NoteToken(note_id=note.pk, token=token, in_title=token in title_tokens,
+                  weight=title_tokens[token] * TITLE_WEIGHT + content_tokens[token])
+        for token in title_tokens.keys() | content_tokens.keys()
+    ]
+
+
+def index_note(note):
+    NoteToken.objects.filter(note=note).delete()
+    NoteToken.objects.bulk_create(note_tokens(note))
+
+
+def unindex_note(note):
+    NoteToken.objects.filter(note=note).delete()
+
+
+def _prefixed(prefix):
+    # 前缀只含 [0-9a-z], 等价于 token__startswith, 但写成范围条件, 各数据库都能使用 token 索引
+    return Q(token__gte=prefix, token__lt=prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def _matches(terms, prefixes, title_only):
+    # 每个子查询给出一组笔记 id: 一组命中全部中文词元, 每个前缀各一组, 结果取交集
+    tokens = NoteToken.objects.filter(in_title=True) if title_only else NoteToken.objects.all()
+    matches = []
+    if terms:
+        matches.append(tokens.filter(token__in=terms).values('note').annotate(matched=Count('token')).filter(
+            matched=len(terms)).values('note'))
+    for prefix in prefixes:
+        matches.append(tokens.filter(_prefixed(prefix)).values('note'))
+    return matches
+
+
+def _filter(notes, terms, prefixes, title_only):
+    for match in _matches(terms, prefixes, title_only):
+        notes = notes.filter(pk__in=match)
+    return notes
+
+
+def filter_notes(notes, query, title_only=False):
+    # ?title= 按词匹配而不是子串: 字母数字词只匹配词首前缀, ear 不会命中 linear
+    terms, prefixes = query_terms(query)
+    if not terms and not prefixes:
+        return notes.filter(title__icontains=query) if title_only else notes.none()
+    return _filter(notes, terms, prefixes, title_only)
+
+
+def search_notes(notes, query):
+    # 命中全部词元的笔记按权重之和排序
+    terms, prefixes = query_terms(query)
+    if not terms and not prefixes:
+        return notes.none().annotate(search_score=Value(0, output_field=IntegerField()))
+    matched = Q(token__in=terms)
+    for prefix in prefixes:
+        matched |= _prefixed(prefix)
+    scores = NoteToken.objects.filter(matched, note=OuterRef('pk')).order_by().values('note').annotate(
+        score=Sum('weight')).values('score')
+    return _filter(notes, terms, prefixes, False).annotate(search_score=Subquery(scores, output_field=IntegerField()))
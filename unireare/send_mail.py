@@ -1,25 +1,33 @@
 import base64
 import hmac
+import json
+import threading
 import time
 import urllib.parse
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import sha1
 
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
 
 
 class AliyunMailSender:
-    def __init__(self, access_id, access_secret):
+    def __init__(self, access_id, access_secret, timeout=10, pool_size=10):
         self.url = "https://dm.aliyuncs.com"
         self.access_id = access_id
         self.access_secret = access_secret
+        self.timeout = timeout
+        self.pool_size = pool_size
+        # 复用 keep-alive 连接, 避免每封邮件重新建立 TCP 与 TLS 连接
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
 
     def sign(self, accesskeysecret, parameters):
-        sortedparameters = sorted(parameters.items(), key=lambda para: para[0])
-        canonicalizedquerystring = ''
-        for (k, v) in sortedparameters:
-            canonicalizedquerystring += '&' + self.percent_encode(k) + '=' + self.percent_encode(v)
-        stringtosign = 'POST&%2F&' + self.percent_encode(canonicalizedquerystring[1:])
+        canonicalizedquerystring = '&'.join(self.percent_encode(k) + '=' + self.percent_encode(v)
+                                            for k, v in sorted(parameters.items()))
+        stringtosign = 'POST&%2F&' + self.percent_encode(canonicalizedquerystring)
         h = hmac.new(bytes(accesskeysecret, 'utf-8') + b"&", stringtosign.encode('utf-8'), sha1)
         signature = base64.b64encode(h.digest()).strip()
         return signature
@@ -55,5 +63,52 @@ class AliyunMailSender:
             'Subject': subject,
             'HtmlBody': text
         }
-        request = requests.post(self.url, self.make_parameters(payload))
+        request = self.session.post(self.url, self.make_parameters(payload), timeout=self.timeout)
         return request.text
+
+    def batch_send_mail(self, account, alias, email_addresses, subject, text):
+        # 通过连接池并发单发, 结果与 email_addresses 一一对应, 发送失败的位置为异常对象
+        def send(email_address):
+            try:
+                return self.single_send_mail(account, alias, email_address, subject, text)
+            except requests.RequestException as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            return list(executor.map(send, email_addresses))
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_mail_sender():
+    # 进程内共享的发送客户端
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = AliyunMailSender(settings.MAIL_ACCESS_KEY, settings.MAIL_ACCESS_SECRET,
+                                       timeout=settings.MAIL_SEND_TIMEOUT, pool_size=settings.MAIL_POOL_SIZE)
+        return _sender
+
+
+class MailError(Exception):
+    pass
+
+
+class AliyunTransport:
+    def send(self, email_address, subject, text):
+        result = json.loads(get_mail_sender().single_send_mail(settings.MAIL_ACCOUNT, settings.MAIL_ALIAS,
+                                                               email_address, subject, text))
+        if 'Code' in result:
+            raise MailError('%s: %s' % (result['Code'], result.get('Message', '')))
+        return result
+
+
+# 测试用, 邮件只保存在内存中
+class LocmemTransport:
+    outbox = []
+
+    def send(self, email_address, subject, text):
+        self.outbox.append((email_address, subject, text))
+        return {}
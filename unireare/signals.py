@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+
+from . import caching
+from .models import Comment, Note, Subject, User
+
+
+def invalidate_cache(sender, instance, **kwargs):
+    caching.invalidate(sender, instance.pk)
+
+
+for model in (User, Subject, Note, Comment):
+    post_save.connect(invalidate_cache, sender=model)
+    post_delete.connect(invalidate_cache, sender=model)
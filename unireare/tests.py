@@ -0,0 +1,1031 @@
+import base64
+import datetime
+import io
+import json
+import re
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from . import catalog, counters, entitlements, feed, outbox, pagination, search, trending
+from .buffers import flush_all
+from .models import *
+from .send_mail import MailError
+
+PASSWORD = 'unireare'
+
+CONTENT = '线性代数复习笔记，矩阵、行列式与特征值的例题总结。' * 15
+
+
+def _image():
+    from PIL import Image as PILImage
+    content = io.BytesIO()
+    PILImage.new('RGB', (16, 16), (200, 120, 40)).save(content, 'PNG')
+    content.seek(0)
+    content.name = 'test.png'
+    return content
+
+
+class ApiTestCase(TestCase):
+    # 小型数据集: 列表接口返回多行且涉及多个作者与科目, 查询次数与行数无关时才能通过
+    @classmethod
+    def setUpClass(cls):
+        # 上传的头像与图片写入临时目录
+        cls.media_root = tempfile.TemporaryDirectory()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root.name)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        cls.media_root.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer@unireare.test', PASSWORD, nickname='读者', balance=1000)
+        cls.author = User.objects.create_user('author@unireare.test', PASSWORD, nickname='作者')
+        cls.other = User.objects.create_user('other@unireare.test', PASSWORD, nickname='路人')
+        cls.spare = User.objects.create_user('spare@unireare.test', PASSWORD, nickname='备用')
+        cls.admin = User.objects.create_superuser('admin@unireare.test', PASSWORD, nickname='管理员')
+        cls.subjects = [Subject.objects.create(name='线性代数'), Subject.objects.create(name='概率论')]
+        cls.notes = []
+        for i in range(6):
+            author = cls.author if i % 2 else cls.other
+            cls.notes.append(cls.add_note(author, cls.subjects[i % 2], '矩阵笔记%d' % i, is_free=i < 3))
+        cls.free, cls.paid = cls.notes[0], cls.notes[3]
+        cls.for_sale = cls.notes[4]
+        cls.own = cls.add_note(cls.viewer, cls.subjects[0], '我的笔记', is_free=True)
+        cls.draft = cls.add_note(cls.viewer, cls.subjects[0], '草稿', is_free=True, is_draft=True)
+        Purchased.objects.create(user=cls.viewer, note=cls.paid)
+        for note in cls.notes[:3]:
+            Collection.objects.create(user=cls.viewer, note=note)
+        for following in (cls.author, cls.other):
+            Follow.objects.create(follower=cls.viewer, following=following)
+            Follow.objects.create(follower=following, following=cls.viewer)
+        for note in cls.notes:
+            feed.fan_out(note)
+        cls.thread = Comment.objects.create(user=cls.author, note=cls.free, content='顶层评论')
+        Comment.objects.create(user=cls.other, note=cls.free, content='另一条顶层评论')
+        cls.reply = Comment.objects.create(user=cls.other, note=cls.free, upp_comment=cls.thread,
+                                           rep_comment=cls.thread, content='回复')
+        Comment.objects.create(user=cls.author, note=cls.free, upp_comment=cls.thread, rep_comment=cls.reply,
+                               content='回复的回复')
+        cls.own_comment = Comment.objects.create(user=cls.viewer, note=cls.free, content='我的评论')
+        cls.messages = [Message.objects.create(from_user=sender, to_user=cls.viewer, content='你好')
+                        for sender in (cls.author, cls.other, cls.author)]
+        trending.compute()
+
+    @classmethod
+    def add_note(cls, user, subject, title, is_free, is_draft=False):
+        note = Note.objects.create(user=user, subject=subject, title=title, content=CONTENT, is_free=is_free,
+                                   price=None if is_free else 5, is_draft=is_draft)
+        search.index_note(note)
+        return note
+
+    def setUp(self):
+        # 每个用例从冷缓存开始, 缓冲的计数写回后重新计时, 避免用例中途触发写回
+        cache.clear()
+        catalog.invalidate()
+        entitlements._known.clear()
+        flush_all()
+
+    def login(self, user):
+        self.client.force_login(user)
+
+    def request(self, queries, method, path, data=None):
+        with self.assertNumQueries(queries):
+            response = getattr(self.client, method)(path, data or {})
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+        body = json.loads(content.decode())
+        self.assertEqual(body['status'], 'success', body)
+        return body.get('data')
+
+    def get(self, path, data=None):
+        # 不限定查询次数
+        body = json.loads(self.client.get(path, data or {}).content.decode())
+        self.assertEqual(body['status'], 'success', body)
+        return body.get('data')
+
+
+class QueryCountTests(ApiTestCase):
+    # 固定每个接口的查询次数; 列表接口的查询次数不随行数增长
+
+    def test_login(self):
+        self.request(9, 'post', '/api/login', {'email': self.viewer.email, 'password': PASSWORD})
+
+    def test_logout(self):
+        self.login(self.viewer)
+        self.request(4, 'get', '/api/logout')
+
+    def test_session(self):
+        self.login(self.viewer)
+        self.request(2, 'get', '/api/session')
+
+    def test_register(self):
+        EmailCode.objects.create(email='new@unireare.test', code='123456')
+        self.request(12, 'post', '/api/register', {
+            'email': 'new@unireare.test', 'code': '123456', 'password': PASSWORD, 'confirm_password': PASSWORD,
+            'nickname': '新用户'
+        })
+
+    def test_register_email_code(self):
+        self.request(4, 'post', '/api/register_email_code', {'email': 'new@unireare.test'})
+
+    def test_reset_password(self):
+        EmailCode.objects.create(email=self.spare.email, code='123456')
+        self.request(5, 'post', '/api/reset_password', {
+            'email': self.spare.email, 'code': '123456', 'password': PASSWORD, 'confirm_password': PASSWORD
+        })
+
+    def test_reset_password_email_code(self):
+        self.request(4, 'post', '/api/reset_password_email_code', {'email': self.viewer.email})
+
+    def test_user_info(self):
+        self.login(self.viewer)
+        self.request(4, 'get', '/api/user_info/%d' % self.author.pk)
+
+    def test_disable_user(self):
+        self.login(self.admin)
+        self.request(5, 'get', '/api/disable_user/%d' % self.spare.pk)
+
+    def test_enable_user(self):
+        User.objects.filter(pk=self.spare.pk).update(is_active=False)
+        self.login(self.admin)
+        self.request(5, 'get', '/api/enable_user/%d' % self.spare.pk)
+
+    def test_modify_user_info(self):
+        self.login(self.viewer)
+        self.request(4, 'post', '/api/modify_user_info', {
+            'nickname': '读者', 'school': '大学', 'major': '数学', 'tel': '13000000000'
+        })
+
+    def test_modify_user_motto(self):
+        self.login(self.viewer)
+        self.request(4, 'post', '/api/modify_user_motto', {'motto': '好好学习'})
+
+    def test_modify_password(self):
+        self.login(self.spare)
+        self.request(11, 'post', '/api/modify_password', {
+            'old_password': PASSWORD, 'password': PASSWORD, 'confirm_password': PASSWORD
+        })
+
+    def test_upload_avatar(self):
+        self.login(self.viewer)
+        self.request(4, 'post', '/api/upload_avatar', {'image': _image()})
+
+    def test_upload_image(self):
+        self.login(self.viewer)
+        self.request(3, 'post', '/api/upload_image', {'image': _image()})
+
+    def test_send_message(self):
+        self.login(self.viewer)
+        self.request(4, 'post', '/api/send_message', {'to_user': self.author.pk, 'content': '你好'})
+
+    def test_message_list(self):
+        self.login(self.viewer)
+        self.request(3, 'get', '/api/message_list')
+        self.request(3, 'get', '/api/message_list', {'normalize': 1})
+        self.request(3, 'get', '/api/message_list', {'stream': 1})
+
+    def test_message_view(self):
+        self.login(self.viewer)
+        self.request(4, 'get', '/api/message/%d' % self.messages[0].pk)
+
+    def test_follow(self):
+        self.login(self.viewer)
+        self.request(12, 'post', '/api/follow', {'following': self.spare.pk})
+
+    def test_following(self):
+        self.login(self.viewer)
+        self.request(3, 'get', '/api/following')
+        self.request(3, 'get', '/api/following', {'normalize': 1})
+
+    def test_followers(self):
+        self.login(self.viewer)
+        self.request(3, 'get', '/api/followers')
+
+    def test_feed(self):
+        self.login(self.viewer)
+        data = self.request(4, 'get', '/api/feed')
+        self.assertTrue(data['notes'])
+
+    def test_subject_list(self):
+        self.login(self.viewer)
+        self.request(4, 'get', '/api/subject_list')
+        self.request(3, 'get', '/api/subject_list', {'name': '线性'})
+
+    def test_add_subject(self):
+        self.login(self.admin)
+        self.request(4, 'post', '/api/add_subject', {'name': '微积分'})
+
+    def test_modify_subject(self):
+        self.login(self.admin)
+        self.request(5, 'post', '/api/modify_subject/%d' % self.subjects[0].pk, {'name': '高等代数'})
+
+    def test_delete_subject(self):
+        self.login(self.admin)
+        self.request(5, 'get', '/api/delete_subject/%d' % self.subjects[1].pk)
+
+    def test_note_list(self):
+        data = self.request(1, 'get', '/api/note_list')
+        self.assertEqual(len(data['notes']), 7)
+        self.request(1, 'get', '/api/note_list', {'normalize': 1})
+        self.request(1, 'get', '/api/note_list', {'fields': 'id,title'})
+        self.request(2, 'get', '/api/note_list', {'subject': self.subjects[0].pk})
+        self.request(2, 'get', '/api/note_list', {'user': self.author.pk})
+        self.request(1, 'get', '/api/note_list', {'keyword': '矩阵'})
+        self.request(1, 'get', '/api/note_list', {'title': '矩阵'})
+        self.request(1, 'get', '/api/note_list', {'stream': 1})
+
+    def test_note_list_marks(self):
+        self.login(self.viewer)
+        self.request(4, 'get', '/api/note_list', {'reactions': 1})
+        self.request(4, 'get', '/api/note_list', {'accessible': 1})
+
+    def test_trending(self):
+        self.request(1, 'get', '/api/trending')
+        self.request(2, 'get', '/api/trending', {'subject': self.subjects[0].pk})
+
+    def test_draft_list(self):
+        self.login(self.viewer)
+        self.request(3, 'get', '/api/draft_list')
+        self.request(3, 'get', '/api/draft_list', {'accessible': 1})
+
+    def test_note_view(self):
+        self.login(self.viewer)
+        self.request(9, 'get', '/api/note/%d' % self.free.pk)
+        self.request(9, 'get', '/api/note/%d' % self.paid.pk)
+
+    def test_add_note(self):
+        self.login(self.viewer)
+        self.request(11, 'post', '/api/add_note', {
+            'subject': self.subjects[0].pk, 'title': '新笔记', 'content': CONTENT, 'is_free': True
+        })
+
+    def test_modify_note(self):
+        self.login(self.viewer)
+        self.request(6, 'post', '/api/modify_note/%d' % self.own.pk, {'title': '修改后的笔记', 'content': CONTENT})
+
+    def test_delete_note(self):
+        self.login(self.viewer)
+        self.request(8, 'get', '/api/delete_note/%d' % self.draft.pk)
+
+    def test_reactions(self):
+        self.login(self.viewer)
+        self.request(6, 'post', '/api/like_note/%d' % self.free.pk)
+        self.request(3, 'post', '/api/unlike_note/%d' % self.free.pk)
+        self.request(6, 'post', '/api/collect_note/%d' % self.for_sale.pk)
+        self.request(3, 'post', '/api/uncollect_note/%d' % self.for_sale.pk)
+
+    def test_purchase_note(self):
+        self.login(self.viewer)
+        self.request(10, 'post', '/api/purchase_note/%d' % self.for_sale.pk)
+
+    def test_collection_list(self):
+        self.login(self.viewer)
+        data = self.request(3, 'get', '/api/collection_list')
+        self.assertEqual(len(data['collections']), 3)
+        self.request(3, 'get', '/api/collection_list', {'normalize': 1})
+
+    def test_comment_list(self):
+        self.login(self.viewer)
+        self.request(5, 'get', '/api/comment_list/%d' % self.free.pk)
+        self.request(5, 'get', '/api/comment_list/%d' % self.free.pk, {'normalize': 1})
+
+    def test_comment_replies(self):
+        self.login(self.viewer)
+        self.request(4, 'get', '/api/comment_replies/%d' % self.thread.pk)
+
+    def test_comment_view(self):
+        self.login(self.viewer)
+        self.request(6, 'get', '/api/comment/%d' % self.reply.pk)
+
+    def test_add_comment(self):
+        self.login(self.viewer)
+        self.request(7, 'post', '/api/add_comment', {
+            'note': self.free.pk, 'upp_comment': 0, 'rep_comment': 0, 'content': '好笔记'
+        })
+        self.request(9, 'post', '/api/add_comment', {
+            'note': self.free.pk, 'upp_comment': self.thread.pk, 'rep_comment': self.reply.pk, 'content': '同意'
+        })
+
+    def test_modify_comment(self):
+        self.login(self.viewer)
+        self.request(4, 'post', '/api/modify_comment/%d' % self.own_comment.pk, {'content': '修改后的评论'})
+
+    def test_delete_comment(self):
+        self.login(self.viewer)
+        self.request(8, 'get', '/api/delete_comment/%d' % self.own_comment.pk)
+
+    def test_profiling(self):
+        self.login(self.admin)
+        self.request(2, 'get', '/api/profiling')
+
+
+class CursorTests(ApiTestCase):
+    # 游标由客户端传回, 格式错误时返回错误信息而不是 500
+
+    MALFORMED = ('!!!', '[]', '{"id": 1}', '[[1]]', '[{"a": 1}]', '[null]', '[true]', '["x"]', '[NaN]', '[1e999]',
+                 '[%d]' % 10 ** 30)
+
+    def assertRejects(self, path, prefix=''):
+        # prefix 为排序字段中 id 之前的合法值
+        for text in self.MALFORMED:
+            if text.startswith('['):
+                text = '[%s%s' % (prefix, text[1:])
+            cursor = base64.urlsafe_b64encode(text.encode()).decode() if text != '!!!' else text
+            with self.subTest(path=path, cursor=text):
+                response = self.client.get(path, {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                body = json.loads(response.content.decode())
+                self.assertEqual((body['status'], body['msg']), ('error', '游标格式错误'))
+
+    def test_note_list(self):
+        self.assertRejects('/api/note_list')
+        self.assertRejects('/api/note_list', '"2020-01-01T00:00:00", ')
+        self.assertRejects('/api/note_list', '[1], ')
+
+    def test_message_list(self):
+        self.login(self.viewer)
+        self.assertRejects('/api/message_list', '"2020-01-01T00:00:00", ')
+
+    def test_feed(self):
+        self.login(self.viewer)
+        self.assertRejects('/api/feed')
+
+    def test_comment_list(self):
+        self.login(self.viewer)
+        self.assertRejects('/api/comment_list/%d' % self.free.pk, '"2020-01-01T00:00:00", ')
+
+    def test_cursor_continues_listing(self):
+        notes = Note.objects.filter(is_draft=False).order_by('-last_updated_at', '-id')
+        cursor = pagination.encode_cursor([notes[2].last_updated_at, notes[2].pk])
+        data = self.request(1, 'get', '/api/note_list', {'cursor': cursor})
+        self.assertEqual([note['id'] for note in data['notes']], [note.pk for note in notes[3:]])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN 的输出格式因数据库而异, 这里按 SQLite 的 EXPLAIN QUERY PLAN 检查')
+class IndexUsageTests(ApiTestCase):
+    # 各接口读取 table 的主查询中, 每张表(含子查询)都应通过索引访问, 而不是扫描整张表
+
+    def assertUsesIndex(self, table, path, data=None):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(path, data or {})
+            if response.streaming:
+                b''.join(response.streaming_content)
+        statement = next((query['sql'] for query in captured
+                          if query['sql'].startswith('SELECT') and '"%s"' % table in query['sql']), None)
+        self.assertIsNotNone(statement, '%s 没有查询 %s' % (path, table))
+        with connection.cursor() as cursor:
+            cursor.execute('%s %s' % (connection.ops.explain_query_prefix(), statement))
+            steps = [row[-1] for row in cursor.fetchall()]
+        for step in steps:
+            if not re.match(r'(SEARCH|SCAN) ', step):
+                continue
+            self.assertRegex(step, r'USING (COVERING )?INDEX|USING INTEGER PRIMARY KEY', '\n'.join(steps))
+
+    def test_note_list(self):
+        self.assertUsesIndex('unireare_note', '/api/note_list')
+        self.assertUsesIndex('unireare_note', '/api/note_list', {'subject': self.subjects[0].pk})
+        self.assertUsesIndex('unireare_note', '/api/note_list', {'user': self.author.pk})
+
+    def test_note_search(self):
+        self.assertUsesIndex('unireare_notetoken', '/api/note_list', {'keyword': '矩阵 lin'})
+
+    def test_draft_list(self):
+        self.login(self.viewer)
+        self.assertUsesIndex('unireare_note', '/api/draft_list')
+
+    def test_trending(self):
+        self.assertUsesIndex('unireare_trendingnote', '/api/trending', {'subject': self.subjects[0].pk})
+
+    def test_feed(self):
+        self.login(self.viewer)
+        self.assertUsesIndex('unireare_feedentry', '/api/feed')
+
+    def test_message_list(self):
+        self.login(self.viewer)
+        self.assertUsesIndex('unireare_message', '/api/message_list')
+
+    def test_follow_lists(self):
+        self.login(self.viewer)
+        self.assertUsesIndex('unireare_follow', '/api/following')
+        self.assertUsesIndex('unireare_follow', '/api/followers')
+
+    def test_collection_list(self):
+        self.login(self.viewer)
+        self.assertUsesIndex('unireare_collection', '/api/collection_list')
+
+    def test_comment_lists(self):
+        self.login(self.viewer)
+        self.assertUsesIndex('unireare_comment', '/api/comment_list/%d' % self.free.pk)
+        self.assertUsesIndex('unireare_comment', '/api/comment_replies/%d' % self.thread.pk)
+
+
+class CommentDeleteTests(ApiTestCase):
+    # 删除顶层评论时一并删除其回复, 笔记的评论数减去实际删除的条数
+
+    def setUp(self):
+        super().setUp()
+        Note.objects.filter(pk=self.free.pk).update(
+            comment_amount=Comment.objects.filter(note=self.free, defunct=False).count())
+
+    def comment_amount(self):
+        return Note.objects.get(pk=self.free.pk).comment_amount
+
+    def delete(self, user, comment):
+        self.login(user)
+        body = json.loads(self.client.get('/api/delete_comment/%d' % comment.pk).content.decode())
+        return body['status'], body['msg']
+
+    def test_thread_cascades_to_replies(self):
+        self.assertEqual(self.comment_amount(), 5)
+        self.assertEqual(self.delete(self.author, self.thread), ('success', '删除成功'))
+        self.assertEqual(self.comment_amount(), 2)
+        self.assertFalse(Comment.objects.filter(upp_comment=self.thread, defunct=False).exists())
+        self.login(self.viewer)
+        body = json.loads(self.client.get('/api/comment/%d' % self.reply.pk).content.decode())
+        self.assertEqual(body['msg'], '评论不存在')
+        data = self.get('/api/comment_list/%d' % self.free.pk)
+        self.assertNotIn(self.thread.pk, [comment['id'] for comment in data['comments']])
+
+    def test_reply_is_deleted_alone(self):
+        self.assertEqual(self.delete(self.other, self.reply), ('success', '删除成功'))
+        self.assertEqual(self.comment_amount(), 4)
+        self.login(self.viewer)
+        data = self.get('/api/comment_replies/%d' % self.thread.pk)
+        self.assertEqual([reply['content'] for reply in data['replies']], ['回复的回复'])
+
+    def test_deleted_replies_are_not_counted_twice(self):
+        self.delete(self.other, self.reply)
+        self.delete(self.author, self.thread)
+        self.assertEqual(self.comment_amount(), 2)
+        self.assertEqual(self.comment_amount(), Comment.objects.filter(note=self.free, defunct=False).count())
+
+    def test_only_author_or_admin(self):
+        self.assertEqual(self.delete(self.viewer, self.thread), ('error', '无权访问该页面'))
+        self.assertEqual(self.comment_amount(), 5)
+        self.assertEqual(self.delete(self.admin, self.thread), ('success', '删除成功'))
+        self.assertEqual(self.delete(self.admin, self.thread), ('error', '评论不存在'))
+        self.assertEqual(self.comment_amount(), 2)
+
+
+@override_settings(COMMENT_REPLY_PREVIEW=2)
+class CommentThreadTests(ApiTestCase):
+    # 顶层评论附带有效回复数与最早的 COMMENT_REPLY_PREVIEW 条回复, 已删除的回复不计入
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.viewer)
+        self.extra = [Comment.objects.create(user=self.viewer, note=self.free, upp_comment=self.thread,
+                                             rep_comment=self.thread, content='回复%d' % i) for i in range(3)]
+        Comment.objects.filter(pk=self.reply.pk).update(defunct=True)
+        # 有效回复按 id: 回复的回复, 回复0, 回复1, 回复2
+        self.replies = list(Comment.objects.filter(upp_comment=self.thread, defunct=False).order_by('id'))
+
+    def threads(self, data):
+        return {comment['id']: comment for comment in data}
+
+    def test_comment_list(self):
+        threads = self.threads(self.get('/api/comment_list/%d' % self.free.pk)['comments'])
+        thread = threads[self.thread.pk]
+        self.assertEqual(thread['reply_count'], 4)
+        self.assertEqual([reply['id'] for reply in thread['replies']], [reply.pk for reply in self.replies[:2]])
+        # 预览中的回复同样带有被回复的评论, 即使它已被删除
+        self.assertEqual(thread['replies'][0]['rep_comment']['id'], self.reply.pk)
+        self.assertEqual((threads[self.own_comment.pk]['reply_count'], threads[self.own_comment.pk]['replies']),
+                         (0, []))
+
+    def test_note_view(self):
+        threads = self.threads(self.get('/api/note/%d' % self.free.pk)['comments'])
+        self.assertEqual(threads[self.thread.pk]['reply_count'], 4)
+        self.assertEqual(len(threads[self.thread.pk]['replies']), 2)
+
+    def test_fields(self):
+        threads = self.threads(self.get('/api/comment_list/%d' % self.free.pk, {'fields': 'id,reply_count'})[
+            'comments'])
+        self.assertEqual(threads[self.thread.pk], {'id': self.thread.pk, 'reply_count': 4})
+        threads = self.threads(self.get('/api/comment_list/%d' % self.free.pk, {'fields': 'id,replies.content'})[
+            'comments'])
+        self.assertEqual(threads[self.thread.pk]['replies'], [{'id': reply.pk, 'content': reply.content}
+                                                              for reply in self.replies[:2]])
+        self.assertNotIn('reply_count', threads[self.thread.pk])
+
+    def test_replies_are_paginated(self):
+        for i in range(8):
+            Comment.objects.create(user=self.viewer, note=self.free, upp_comment=self.thread,
+                                   rep_comment=self.thread, content='更多回复%d' % i)
+        first = self.get('/api/comment_replies/%d' % self.thread.pk)
+        self.assertEqual(len(first['replies']), 10)
+        second = self.get('/api/comment_replies/%d' % self.thread.pk, {'cursor': first['next_cursor']})
+        self.assertIsNone(second['next_cursor'])
+        ids = [reply['id'] for reply in first['replies'] + second['replies']]
+        self.assertEqual(ids, list(Comment.objects.filter(upp_comment=self.thread, defunct=False).order_by(
+            'added_at', 'id').values_list('id', flat=True)))
+
+
+class SearchTests(ApiTestCase):
+    # 中文按二字词元匹配, 字母数字按单词前缀匹配; ?title= 只匹配标题, ?keyword= 按权重排序
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        subject = cls.subjects[0]
+        cls.topology = cls.add_note(cls.author, subject, '拓扑学入门', is_free=True)
+        cls.reversed = cls.add_note(cls.other, subject, '空间笔记', is_free=True)
+        Note.objects.filter(pk=cls.reversed.pk).update(content='学拓扑')
+        cls.reversed.content = '学拓扑'
+        search.index_note(cls.reversed)
+        cls.linear = cls.add_note(cls.author, subject, 'Linear Algebra', is_free=True)
+        cls.mentions = cls.add_note(cls.other, subject, 'Notes', is_free=True)
+        Note.objects.filter(pk=cls.mentions.pk).update(content='linear linear linear')
+        cls.mentions.content = 'linear linear linear'
+        search.index_note(cls.mentions)
+
+    def search(self, **params):
+        return [note['id'] for note in self.get('/api/note_list', params)['notes']]
+
+    def test_cjk_bigrams(self):
+        self.assertEqual(self.search(keyword='拓扑学'), [self.topology.pk])
+        self.assertEqual(set(self.search(keyword='拓扑')), {self.topology.pk, self.reversed.pk})
+        self.assertEqual(set(self.search(keyword='拓')), {self.topology.pk, self.reversed.pk})
+        self.assertEqual(self.search(keyword='扑学入'), [self.topology.pk])
+        self.assertEqual(self.search(keyword='拓学'), [])
+
+    def test_latin_prefixes(self):
+        self.assertEqual(set(self.search(keyword='lin')), {self.linear.pk, self.mentions.pk})
+        self.assertEqual(self.search(keyword='LINEAR alg'), [self.linear.pk])
+        # 前缀从词首开始, 词中间的子串不会命中
+        self.assertEqual(self.search(keyword='ear'), [])
+        self.assertEqual(self.search(keyword='linear zzz'), [])
+
+    def test_title_only(self):
+        self.assertEqual(self.search(title='linear'), [self.linear.pk])
+        self.assertEqual(self.search(title='lin'), [self.linear.pk])
+        self.assertEqual(self.search(title='ear'), [])
+        self.assertEqual(self.search(title='拓扑'), [self.topology.pk])
+
+    def test_ranked_by_score(self):
+        # 标题中的词元权重为 TITLE_WEIGHT, 高于正文中出现三次
+        self.assertEqual(self.search(keyword='linear'), [self.linear.pk, self.mentions.pk])
+        self.assertEqual(self.search(keyword='拓扑'), [self.topology.pk, self.reversed.pk])
+
+    def post(self, path, data=None):
+        body = json.loads(self.client.post(path, data or {}).content.decode())
+        self.assertEqual(body['status'], 'success', body)
+
+    def test_index_follows_writes(self):
+        self.login(self.author)
+        self.post('/api/modify_note/%d' % self.linear.pk, {'title': 'Calculus', 'content': '极限与导数' * 60})
+        self.assertEqual(self.search(keyword='linear'), [self.mentions.pk])
+        self.assertEqual(self.search(keyword='calc'), [self.linear.pk])
+        self.assertEqual(self.search(keyword='极限'), [self.linear.pk])
+        self.post('/api/add_note', {'subject': self.subjects[0].pk, 'title': 'Geometry', 'content': CONTENT,
+                                    'is_free': True})
+        added = Note.objects.get(title='Geometry')
+        self.assertEqual(self.search(keyword='geo'), [added.pk])
+        self.login(self.admin)
+        self.client.get('/api/delete_note/%d' % added.pk)
+        self.assertEqual(self.search(keyword='geo'), [])
+        self.assertFalse(NoteToken.objects.filter(note=added).exists())
+
+
+class ConditionalGetTests(ApiTestCase):
+    # 校验值未变时返回 304, 任何影响响应内容的写入都会改变 ETag, 且新 ETag 不会搭配旧内容
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.viewer)
+
+    def write(self, user, path, data=None):
+        client = Client()
+        client.force_login(user)
+        body = json.loads(client.post(path, data or {}).content.decode())
+        self.assertEqual(body['status'], 'success', body)
+
+    def assertRevalidates(self, path, data=None):
+        response = self.client.get(path, data or {})
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        not_modified = self.client.get(path, data or {}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((not_modified.status_code, not_modified.content), (304, b''))
+        self.assertEqual(not_modified['ETag'], etag)
+        if response.has_header('Last-Modified'):
+            not_modified = self.client.get(path, data or {}, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(not_modified.status_code, 304)
+        return etag
+
+    def assertChanges(self, path, write, data=None):
+        # 返回写入后的响应数据
+        etag = self.assertRevalidates(path, data)
+        write()
+        response = self.client.get(path, data or {}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertRevalidates(path, data)
+        return json.loads(response.content.decode())['data']
+
+    def test_note_view(self):
+        path = '/api/note/%d' % self.own.pk
+        data = self.assertChanges(path, lambda: self.write(self.viewer, '/api/modify_note/%d' % self.own.pk, {
+            'title': '修改后的笔记', 'content': CONTENT}))
+        self.assertEqual(data['note']['title'], '修改后的笔记')
+        data = self.assertChanges(path, lambda: self.write(self.author, '/api/add_comment', {
+            'note': self.own.pk, 'upp_comment': 0, 'rep_comment': 0, 'content': '好笔记'}))
+        self.assertEqual([comment['content'] for comment in data['comments']], ['好笔记'])
+        data = self.assertChanges(path, lambda: self.write(self.author, '/api/like_note/%d' % self.own.pk))
+        self.assertEqual(data['note']['liking_amount'], 1)
+        data = self.assertChanges(path, lambda: self.write(self.viewer, '/api/modify_user_motto', {
+            'motto': '新签名'}))
+        self.assertEqual(data['note']['user']['motto'], '新签名')
+        data = self.assertChanges(path, lambda: self.write(self.admin, '/api/modify_subject/%d' % self.own.subject_id, {
+            'name': '高等代数'}))
+        self.assertEqual(data['note']['subject']['name'], '高等代数')
+
+    def test_note_list(self):
+        path = '/api/note_list'
+        data = self.assertChanges(path, lambda: self.write(self.viewer, '/api/modify_note/%d' % self.own.pk, {
+            'title': '修改后的笔记', 'content': CONTENT}))
+        self.assertIn('修改后的笔记', [note['title'] for note in data['notes']])
+        data = self.assertChanges(path, lambda: self.write(self.author, '/api/like_note/%d' % self.own.pk))
+        self.assertEqual([note['liking_amount'] for note in data['notes'] if note['id'] == self.own.pk], [1])
+        data = self.assertChanges(path, lambda: self.write(self.author, '/api/modify_user_motto', {
+            'motto': '新签名'}))
+        self.assertIn('新签名', [note['user']['motto'] for note in data['notes']])
+        data = self.assertChanges(path, lambda: self.write(self.admin, '/api/modify_subject/%d' % self.subjects[1].pk, {
+            'name': '数理统计'}))
+        self.assertIn('数理统计', [note['subject']['name'] for note in data['notes']])
+        self.assertChanges(path, lambda: self.write(self.viewer, '/api/like_note/%d' % self.free.pk),
+                           {'reactions': 1})
+
+    def test_user_info(self):
+        path = '/api/user_info/%d' % self.author.pk
+        data = self.assertChanges(path, lambda: self.write(self.author, '/api/modify_user_motto', {
+            'motto': '新签名'}))
+        self.assertEqual(data['motto'], '新签名')
+        data = self.assertChanges(path, lambda: self.write(self.author, '/api/modify_user_info', {
+            'nickname': '新昵称', 'school': '大学', 'major': '数学', 'tel': '13000000000'}))
+        self.assertEqual(data['nickname'], '新昵称')
+
+    def test_subject_list(self):
+        path = '/api/subject_list'
+        data = self.assertChanges(path, lambda: self.write(self.admin, '/api/modify_subject/%d' % self.subjects[0].pk, {
+            'name': '高等代数'}))
+        self.assertIn('高等代数', [subject['name'] for subject in data['subjects']])
+        data = self.assertChanges(path, lambda: self.write(self.admin, '/api/add_subject', {'name': '微积分'}))
+        self.assertIn('微积分', [subject['name'] for subject in data['subjects']])
+        data = self.assertChanges(path, lambda: self.write(self.author, '/api/add_note', {
+            'subject': self.subjects[0].pk, 'title': '新笔记', 'content': CONTENT, 'is_free': True}))
+        amounts = {subject['id']: subject['note_amount'] for subject in data['subjects']}
+        self.assertEqual(amounts[self.subjects[0].pk], Subject.objects.get(pk=self.subjects[0].pk).note_amount)
+
+
+class StaleCacheTests(ApiTestCase):
+    # 其他进程的修改不会清理本进程的缓存, 这里用 QuerySet.update 模拟(不触发 post_save), 响应仍应是最新内容
+
+    def modify_elsewhere(self, model, pk, **values):
+        if model is User:
+            values['version'] = F('version') + 1
+        else:
+            values['last_updated_at'] = timezone.now()
+        model.objects.filter(pk=pk).update(**values)
+
+    def test_comment(self):
+        self.login(self.viewer)
+        path = '/api/comment/%d' % self.reply.pk
+        self.get(path)
+        self.modify_elsewhere(Comment, self.reply.pk, content='新回复')
+        self.assertEqual(self.get(path)['content'], '新回复')
+
+    def test_comment_related(self):
+        self.login(self.viewer)
+        reply = Comment.objects.create(user=self.other, note=self.free, upp_comment=self.thread,
+                                       rep_comment=self.reply, content='回复的回复')
+        path = '/api/comment/%d' % reply.pk
+        self.get(path)
+        self.modify_elsewhere(Comment, self.thread.pk, content='新顶层评论')
+        self.modify_elsewhere(Comment, self.reply.pk, content='新回复')
+        data = self.get(path)
+        self.assertEqual((data['upp_comment']['content'], data['rep_comment']['content']), ('新顶层评论', '新回复'))
+
+    def test_comment_authors(self):
+        self.login(self.viewer)
+        path = '/api/comment/%d' % self.reply.pk
+        self.get(path)
+        self.modify_elsewhere(User, self.other.pk, nickname='改名的路人')
+        self.modify_elsewhere(User, self.author.pk, nickname='改名的作者')
+        data = self.get(path)
+        self.assertEqual(data['user']['nickname'], '改名的路人')
+        self.assertEqual(data['upp_comment']['user']['nickname'], '改名的作者')
+
+    def test_note(self):
+        self.login(self.viewer)
+        path = '/api/note/%d' % self.free.pk
+        self.get(path)
+        self.modify_elsewhere(Note, self.free.pk, title='新标题')
+        self.modify_elsewhere(User, self.free.user_id, nickname='改名的作者')
+        data = self.get(path)['note']
+        self.assertEqual((data['title'], data['user']['nickname']), ('新标题', '改名的作者'))
+
+    def test_user_info(self):
+        self.login(self.viewer)
+        path = '/api/user_info/%d' % self.author.pk
+        self.get(path)
+        self.modify_elsewhere(User, self.author.pk, motto='新签名')
+        self.assertEqual(self.get(path)['motto'], '新签名')
+
+
+class PurchaseTests(TransactionTestCase):
+    # 多个线程同时购买, 各自使用独立的数据库连接, 结束后余额、收益、购买记录、订单与购买量应当一致
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('SQLite 内存数据库的并发写入不等待锁而是直接报错, 需要使用 settings_test')
+        entitlements._known.clear()
+        self.author = User.objects.create_user('author@unireare.test', PASSWORD, nickname='作者')
+        self.buyer = User.objects.create_user('buyer@unireare.test', PASSWORD, nickname='买家', balance=15)
+        subject = Subject.objects.create(name='线性代数')
+        self.notes = [Note.objects.create(user=self.author, subject=subject, title='付费笔记%d' % i, content=CONTENT,
+                                          price=5) for i in range(8)]
+
+    def purchase_concurrently(self, notes):
+        barrier = threading.Barrier(len(notes))
+        results = [None] * len(notes)
+
+        def buy(index, note):
+            try:
+                buyer = User.objects.get(pk=self.buyer.pk)
+                barrier.wait()
+                entitlements.purchase(buyer, note)
+                results[index] = True
+            except entitlements.PurchaseError as e:
+                results[index] = str(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(index, note)) for index, note in enumerate(notes)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def assertConsistent(self, purchases):
+        buyer = User.objects.get(pk=self.buyer.pk)
+        author = User.objects.get(pk=self.author.pk)
+        spent = Order.objects.filter(user=buyer).aggregate(total=Sum('price'))['total'] or 0
+        self.assertEqual(Purchased.objects.filter(user=buyer).count(), purchases)
+        self.assertEqual(Order.objects.filter(user=buyer).count(), purchases)
+        self.assertEqual(Note.objects.aggregate(total=Sum('purchase_amount'))['total'], purchases)
+        self.assertEqual(buyer.balance, 15 - spent)
+        self.assertEqual(author.earnings, spent)
+        self.assertGreaterEqual(buyer.balance, 0)
+
+    def test_balance_limits_concurrent_purchases(self):
+        results = self.purchase_concurrently(self.notes)
+        self.assertEqual(results.count(True), 3, results)
+        self.assertEqual(set(results) - {True}, {'余额不足'})
+        self.assertConsistent(3)
+
+    def test_same_note_is_bought_once(self):
+        results = self.purchase_concurrently([self.notes[0]] * 6)
+        self.assertEqual(results.count(True), 1, results)
+        self.assertEqual(set(results) - {True}, {'已购买该笔记'})
+        self.assertConsistent(1)
+
+
+class ReactionTests(ApiTestCase):
+    # 点赞与收藏的计数写回时按成员关系重新统计, 重复操作与丢失的增量都不会使计数偏离
+
+    def amounts(self, note):
+        flush_all()
+        note = Note.objects.get(pk=note.pk)
+        return note.liking_amount, note.collect_amount
+
+    def test_repeated_like_counts_once(self):
+        self.login(self.viewer)
+        for _ in range(2):
+            self.client.post('/api/like_note/%d' % self.for_sale.pk)
+        self.assertEqual(self.amounts(self.for_sale), (1, 0))
+        for _ in range(2):
+            self.client.post('/api/unlike_note/%d' % self.for_sale.pk)
+        self.assertEqual(self.amounts(self.for_sale), (0, 0))
+
+    def test_repeated_collect_counts_once(self):
+        self.login(self.viewer)
+        for _ in range(2):
+            self.client.post('/api/collect_note/%d' % self.for_sale.pk)
+        self.assertEqual(self.amounts(self.for_sale), (0, 1))
+        for _ in range(2):
+            self.client.post('/api/uncollect_note/%d' % self.for_sale.pk)
+        self.assertEqual(self.amounts(self.for_sale), (0, 0))
+
+    def test_pending_amount_is_shown_before_flush(self):
+        self.login(self.viewer)
+        self.client.post('/api/like_note/%d' % self.free.pk)
+        self.assertEqual(Note.objects.get(pk=self.free.pk).liking_amount, 0)
+        data = json.loads(self.client.get('/api/note/%d' % self.free.pk).content.decode())['data']
+        self.assertEqual(data['note']['liking_amount'], 1)
+
+    def test_flush_repairs_drifted_counter(self):
+        # 其他进程退出时未写回的增量: 计数与成员关系不一致, 下次写回时纠正
+        Like.objects.create(user=self.other, note=self.for_sale)
+        Note.objects.filter(pk=self.for_sale.pk).update(liking_amount=42)
+        self.login(self.viewer)
+        self.client.post('/api/like_note/%d' % self.for_sale.pk)
+        self.assertEqual(self.amounts(self.for_sale), (2, 0))
+        Collection.objects.create(user=self.other, note=self.notes[5])
+        self.client.post('/api/collect_note/%d' % self.notes[5].pk)
+        self.assertEqual(self.amounts(self.notes[5]), (0, 2))
+
+    def test_get_is_rejected(self):
+        # 笔记内容中的 <img src="/api/like_note/..."> 不能替读者点赞或收藏
+        self.login(self.viewer)
+        for name in ('like_note', 'unlike_note', 'collect_note', 'uncollect_note'):
+            response = self.client.get('/api/%s/%d' % (name, self.free.pk))
+            self.assertEqual(response.status_code, 405)
+        self.assertFalse(Like.objects.filter(note=self.free).exists())
+        self.assertTrue(Collection.objects.filter(user=self.viewer, note=self.free).exists())
+
+
+class PurchaseNoteTests(ApiTestCase):
+    # 购买会扣款, 只接受 POST: 笔记内容中的 <img src="/api/purchase_note/..."> 不能替读者购买
+
+    def test_get_is_rejected(self):
+        self.login(self.viewer)
+        response = self.client.get('/api/purchase_note/%d' % self.for_sale.pk)
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(User.objects.get(pk=self.viewer.pk).balance, self.viewer.balance)
+        self.assertFalse(Purchased.objects.filter(user=self.viewer, note=self.for_sale).exists())
+
+    def test_post_purchases_once(self):
+        self.login(self.viewer)
+        self.request(10, 'post', '/api/purchase_note/%d' % self.for_sale.pk)
+        response = self.client.post('/api/purchase_note/%d' % self.for_sale.pk)
+        self.assertEqual(json.loads(response.content.decode())['msg'], '已购买该笔记')
+        self.assertEqual(User.objects.get(pk=self.viewer.pk).balance, self.viewer.balance - 5)
+        self.assertEqual(User.objects.get(pk=self.for_sale.user_id).earnings, 5)
+
+
+class FlakyTransport:
+    # 前 failures 次发送失败, 之后成功; sent 记录成功发送的收件人
+    def __init__(self, failures=0, during_send=None):
+        self.failures = failures
+        self.during_send = during_send
+        self.sent = []
+
+    def send(self, email_address, subject, text):
+        if self.during_send is not None:
+            self.during_send()
+        if self.failures:
+            self.failures -= 1
+            raise MailError('发送失败')
+        self.sent.append(email_address)
+        return {}
+
+
+@override_settings(MAIL_OUTBOX_THREADS=0, MAIL_MAX_ATTEMPTS=3, MAIL_RETRY_BASE_DELAY=30, MAIL_SEND_TIMEOUT=10)
+class OutboxTests(TestCase):
+
+    def use(self, transport):
+        for patcher in (mock.patch.object(outbox, '_transport', transport), mock.patch.object(outbox, 'logger')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return transport
+
+    def enqueue(self):
+        return outbox.enqueue('user@unireare.test', '验证码', '123456')
+
+    def make_due(self, mail):
+        # 模拟时间流逝到下次尝试时间
+        MailOutbox.objects.filter(pk=mail.pk).update(next_attempt_at=timezone.now())
+
+    def test_sends_once(self):
+        transport = self.use(FlakyTransport())
+        mail = self.enqueue()
+        self.assertTrue(outbox.deliver(mail.pk))
+        self.assertFalse(outbox.deliver(mail.pk))
+        self.assertEqual(transport.sent, ['user@unireare.test'])
+        mail.refresh_from_db()
+        self.assertEqual((mail.is_sent, mail.attempts), (True, 1))
+
+    def test_lease_blocks_concurrent_sender(self):
+        mail = self.enqueue()
+        during = []
+
+        def concurrent_sender():
+            leased = MailOutbox.objects.get(pk=mail.pk)
+            during.append((outbox.deliver(mail.pk), leased.next_attempt_at - timezone.now()))
+
+        transport = self.use(FlakyTransport(during_send=concurrent_sender))
+        self.assertTrue(outbox.deliver(mail.pk))
+        delivered, lease = during[0]
+        self.assertFalse(delivered)
+        self.assertGreater(lease, datetime.timedelta(seconds=10))
+        self.assertEqual(len(transport.sent), 1)
+
+    def test_retry_backs_off_exponentially(self):
+        transport = self.use(FlakyTransport(failures=2))
+        mail = self.enqueue()
+        for attempts in (1, 2):
+            before = timezone.now()
+            self.assertFalse(outbox.deliver(mail.pk))
+            mail.refresh_from_db()
+            self.assertEqual(mail.attempts, attempts)
+            self.assertIn('发送失败', mail.last_error)
+            delay = (mail.next_attempt_at - before).total_seconds()
+            self.assertAlmostEqual(delay, 30 * 2 ** (attempts - 1), delta=1)
+            # 未到下次尝试时间不重试
+            self.assertFalse(outbox.deliver(mail.pk))
+            self.assertEqual(outbox.process_outbox(), 0)
+            self.make_due(mail)
+        self.assertEqual(outbox.process_outbox(), 1)
+        mail.refresh_from_db()
+        self.assertEqual((mail.is_sent, mail.attempts), (True, 3))
+        self.assertEqual(len(transport.sent), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        transport = self.use(FlakyTransport(failures=10))
+        mail = self.enqueue()
+        for _ in range(3):
+            self.assertFalse(outbox.deliver(mail.pk))
+            self.make_due(mail)
+        self.assertEqual(transport.failures, 7)
+        self.assertFalse(outbox.deliver(mail.pk))
+        self.assertEqual(outbox.process_outbox(), 0)
+        self.assertEqual(transport.failures, 7)
+        mail.refresh_from_db()
+        self.assertEqual((mail.is_sent, mail.attempts), (False, 3))
+
+
+@override_settings(MAIL_OUTBOX_THREADS=2, MAIL_MAX_ATTEMPTS=3, MAIL_RETRY_BASE_DELAY=0.1,
+                   MAIL_RETRY_POLL_INTERVAL=0.05)
+class OutboxThreadTests(TransactionTestCase):
+    # 线程池模式下失败的邮件由进程内重试, 不依赖 mail_worker
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('发送线程使用独立的数据库连接, 需要使用 settings_test')
+
+    def test_pool_retries_failed_mail(self):
+        transport = FlakyTransport(failures=2)
+        with mock.patch.object(outbox, '_transport', transport), mock.patch.object(outbox, 'logger'):
+            with transaction.atomic():
+                mail = outbox.enqueue('user@unireare.test', '验证码', '123456')
+            for _ in range(100):
+                if MailOutbox.objects.filter(pk=mail.pk, is_sent=True).exists():
+                    break
+                time.sleep(0.05)
+        mail.refresh_from_db()
+        self.assertEqual((mail.is_sent, mail.attempts), (True, 3))
+        self.assertEqual(transport.sent, ['user@unireare.test'])
+
+
+class ProfileWriteTests(ApiTestCase):
+    # 修改资料与密码时只写修改的列, 请求期间并发入账的收益与余额不会被请求开始时读到的旧值覆盖
+
+    def assertKeepsCredit(self, path, data):
+        save = User.save
+        credited = []
+
+        def credit_then_save(user, *args, **kwargs):
+            # 只在第一次保存前入账, 修改密码后重新登录时还会保存一次 last_login
+            if not credited:
+                counters.update(User, user.pk, balance=7, earnings=5)
+                credited.append(user.pk)
+            return save(user, *args, **kwargs)
+
+        self.login(self.author)
+        with mock.patch.object(User, 'save', credit_then_save):
+            response = self.client.post(path, data)
+        self.assertEqual(json.loads(response.content.decode())['status'], 'success')
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual((author.balance, author.earnings), (self.author.balance + 7, self.author.earnings + 5))
+        return author
+
+    def test_modify_user_info(self):
+        author = self.assertKeepsCredit('/api/modify_user_info', {
+            'nickname': '新昵称', 'school': '大学', 'major': '数学', 'tel': '13000000000'
+        })
+        self.assertEqual(author.nickname, '新昵称')
+
+    def test_modify_user_motto(self):
+        self.assertKeepsCredit('/api/modify_user_motto', {'motto': '好好学习'})
+
+    def test_modify_password(self):
+        self.assertKeepsCredit('/api/modify_password', {
+            'old_password': PASSWORD, 'password': PASSWORD, 'confirm_password': PASSWORD
+        })
+
+    def test_upload_avatar(self):
+        self.assertKeepsCredit('/api/upload_avatar', {'image': _image()})
@@ -0,0 +1,96 @@
+import datetime
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import encoding
+from .listing import NoteProjection
+from .models import Note, TrendingNote
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+COUNTERS = ('reading_amount', 'liking_amount', 'collect_amount', 'comment_amount', 'purchase_amount')
+
+
+# 热度 = (加权互动量 + 1) / (发布后小时数 + 2) ^ TRENDING_GRAVITY, 两种实现结果相同
+
+def python_rank(ids, subjects, added, counters, now, k):
+    weights = [settings.TRENDING_WEIGHTS[name] for name in COUNTERS]
+    groups = defaultdict(list)
+    for pk, subject, added_at, values in zip(ids, subjects, added, counters):
+        engagement = sum(weight * value for weight, value in zip(weights, values))
+        age = max((now - added_at).total_seconds() / 3600, 0)
+        groups[subject].append(((engagement + 1) / (age + 2) ** settings.TRENDING_GRAVITY, pk))
+    # 同分时 id 大(较新)者在前
+    ranking = {subject: heapq.nlargest(k, items) for subject, items in groups.items()}
+    ranking[None] = heapq.nlargest(k, (item for items in ranking.values() for item in items))
+    return {subject: [(pk, score) for score, pk in items] for subject, items in ranking.items()}
+
+
+def numpy_rank(ids, subjects, added, counters, now, k):
+    if not ids:
+        return {None: []}
+    weights = numpy.array([settings.TRENDING_WEIGHTS[name] for name in COUNTERS], dtype=numpy.float64)
+    ids = numpy.array(ids, dtype=numpy.int64)
+    subjects = numpy.array(subjects, dtype=numpy.int64)
+    counters = numpy.array(counters, dtype=numpy.float64).reshape(len(ids), len(COUNTERS))
+    age = (numpy.datetime64(now, 'us') - numpy.array(added, dtype='datetime64[us]')) / numpy.timedelta64(1, 'h')
+    scores = (counters @ weights + 1) / (numpy.maximum(age, 0) + 2) ** settings.TRENDING_GRAVITY
+    # 按科目、热度、id 排序后每个科目取前 k 个
+    order = numpy.lexsort((-ids, -scores, subjects))
+    ordered = subjects[order]
+    starts = numpy.flatnonzero(numpy.r_[True, ordered[1:] != ordered[:-1]])
+    ranking = {}
+    for start, end in zip(starts, numpy.r_[starts[1:], len(order)]):
+        top = order[start:min(end, start + k)]
+        ranking[int(subjects[top[0]])] = top
+    overall = numpy.concatenate(list(ranking.values()))
+    ranking[None] = overall[numpy.lexsort((-ids[overall], -scores[overall]))][:k]
+    return {subject: [(int(ids[i]), float(scores[i])) for i in top] for subject, top in ranking.items()}
+
+
+def rank(now, k):
+    # 只读取计分所需的列
+    notes = Note.objects.filter(is_draft=False, defunct=False, subject__defunct=False)
+    if settings.TRENDING_MAX_AGE_DAYS is not None:
+        notes = notes.filter(added_at__gte=now - datetime.timedelta(days=settings.TRENDING_MAX_AGE_DAYS))
+    ids, subjects, added, counters = [], [], [], []
+    for row in notes.values_list('id', 'subject_id', 'added_at', *COUNTERS).iterator():
+        ids.append(row[0])
+        subjects.append(row[1])
+        added.append(row[2])
+        counters.append(row[3:])
+    return (numpy_rank if numpy is not None else python_rank)(ids, subjects, added, counters, now, k)
+
+
+def compute(k=None):
+    # 重新计算全站与各科目的排行, 与 note_list 相同的笔记结构预先序列化后整体替换
+    k = k or settings.TRENDING_TOP_K
+    now = timezone.now()
+    ranking = rank(now, k)
+    pks = sorted({pk for items in ranking.values() for pk, _ in items})
+    projection = NoteProjection()
+    payloads = {}
+    for start in range(0, len(pks), 500):
+        for row in projection.rows(Note.objects.filter(pk__in=pks[start:start + 500])):
+            payloads[row.id] = encoding.dumps(projection.to_dict(row)).decode()
+    entries = [TrendingNote(subject_id=subject, rank=position, note_id=pk, score=score, payload=payloads[pk],
+                            computed_at=now)
+               for subject, items in ranking.items() for position, (pk, score) in enumerate(items, 1)]
+    with transaction.atomic():
+        TrendingNote.objects.all().delete()
+        TrendingNote.objects.bulk_create(entries)
+    return len(entries)
+
+
+def render(payloads, extra):
+    # 直接拼接预先序列化的笔记, 与 ajax('success', '', {..., 'notes': [...]}) 输出一致
+    data = encoding.dumps(extra).decode()[:-1]
+    return '{"status": "success", "msg": "", "data": %s%s"notes": [%s]}}' % (
+        data, ', ' if extra else '', ', '.join(payloads))
@@ -1,15 +1,23 @@
 import datetime
 import random
+from functools import partial
 
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import check_password
-from django.core.paginator import Paginator
-from django.http import JsonResponse
-
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+
+from . import (caching, catalog, conditional, counters, encoding, entitlements, feed, fieldsets, lookups, normalize,
+               outbox, profiling, reactions, search, trending)
+from .buffers import reading_counter
+from .comments import reply_page, thread_page
+from .entitlements import PurchaseError
 from .forms import *
+from .listing import NoteProjection
 from .models import *
-from .send_mail import AliyunMailSender
+from .pagination import PageError, iterate_pages, paginate, paginate_list
 
 User = get_user_model()
 
@@ -20,6 +28,11 @@ email_code_content = '''<p>尊敬的用户：</p>
 <p><br/></p>
 <p>爱分享团队</p>'''
 
+note_ordering = ('-last_updated_at', '-id')
+message_ordering = ('-sended_at', '-id')
+follow_ordering = ('-followed_at', '-id')
+collection_ordering = ('-collected_at', '-id')
+
 
 def ajax(status, msg, data=None, extra=None):
     json_data = {
@@ -29,9 +42,34 @@ def ajax(status, msg, data=None, extra=None):
     if data is not None:
         json_data['data'] = data
     if extra is not None:
-        for item in extra:
-            json_data[item] = extra[item]
-    json_resp = JsonResponse(json_data)
+        json_data.update(extra)
+    with profiling.timer('json'):
+        json_resp = HttpResponse(encoding.dumps(json_data), content_type='application/json')
+    json_resp['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    json_resp['Pragma'] = 'no-cache'
+    json_resp['Expires'] = '0'
+    return json_resp
+
+
+def ajax_encoded(content):
+    # 已序列化的响应
+    return HttpResponse(content, content_type='application/json')
+
+
+def ajax_stream(key, pages, serialize, tables=None):
+    # 逐批输出 {"status": "success", "msg": "", "data": {key: [...]}}, tables 中的附表在列表之后输出
+    def content():
+        yield b'{"status": "success", "msg": "", "data": {' + encoding.dumps(key) + b': ['
+        separator = b''
+        for page in pages:
+            yield separator + b', '.join(encoding.dumps(serialize(item)) for item in page)
+            separator = b', '
+        yield b']'
+        for name, table in (tables or {}).items():
+            yield b', ' + encoding.dumps(name) + b': ' + encoding.dumps(table)
+        yield b'}}'
+
+    json_resp = StreamingHttpResponse(content(), content_type='application/json')
     json_resp['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     json_resp['Pragma'] = 'no-cache'
     json_resp['Expires'] = '0'
@@ -62,7 +100,7 @@ def session(request):
     if request.user.is_authenticated:
         return ajax('success', '', {
             'is_logged_in': True,
-            'user': request.user.to_dict(lite=False)
+            'user': request.user.to_dict(lite=False, fields=fieldsets.parse(request))
         })
     else:
         return ajax('success', '', {
@@ -82,23 +120,22 @@ def register(request):
                     'code': 'invalid',
                 }]
             })
-        res = User.objects.filter(email=form.cleaned_data['email'])
-        if len(res) > 0:
+        if lookups.email_registered(form.cleaned_data['email']):
             return ajax('error', '', {
                 'email': [{
                     'message': '邮箱已被使用',
                     'code': 'invalid',
                 }]
             })
-        res = EmailCode.objects.filter(email=form.cleaned_data['email'], code=form.cleaned_data['code'])
-        if len(res) == 0:
+        ecode = lookups.get_email_code(form.cleaned_data['email'], form.cleaned_data['code'])
+        if ecode is None:
             return ajax('error', '', {
                 'code': [{
                     'message': '邮箱验证码错误',
                     'code': 'invalid',
                 }]
             })
-        if (datetime.datetime.now() - res[0].created_at).total_seconds() > 3600 * 24:
+        if (datetime.datetime.now() - ecode.created_at).total_seconds() > 3600 * 24:
             return ajax('error', '', {
                 'code': [{
                     'message': '邮箱验证码已失效，请重新发送',
@@ -119,8 +156,7 @@ def register_email_code(request):
         return ajax('error', '已登录')
     form = EmailCodeForm(request.POST)
     if form.is_valid():
-        res = User.objects.filter(email=form.cleaned_data['email'])
-        if len(res) > 0:
+        if lookups.email_registered(form.cleaned_data['email']):
             return ajax('error', '', {
                 'email': [{
                     'message': '邮箱已被使用',
@@ -129,9 +165,7 @@ def register_email_code(request):
             })
         ecode = EmailCode(email=form.cleaned_data['email'], code=random.randint(100000, 999999))
         ecode.save()
-        aliyun_mail_sender = AliyunMailSender(settings.MAIL_ACCESS_KEY, settings.MAIL_ACCESS_SECRET)
-        aliyun_mail_sender.single_send_mail(settings.MAIL_ACCOUNT, '爱分享', ecode.email, email_code_subject,
-                                            email_code_content % ecode.code)
+        outbox.enqueue(ecode.email, email_code_subject, email_code_content % ecode.code)
         return ajax('success', '验证码已发送，请查收邮件')
     else:
         return ajax('error', '', form.errors.get_json_data())
@@ -149,23 +183,23 @@ def reset_password(request):
                     'code': 'invalid',
                 }]
             })
-        users = User.objects.filter(email=form.cleaned_data['email'])
-        if len(users) == 0:
+        user = User.objects.filter(email=form.cleaned_data['email']).first()
+        if user is None:
             return ajax('error', '', {
                 'email': [{
                     'message': '电子邮箱不存在',
                     'code': 'invalid',
                 }]
             })
-        res = EmailCode.objects.filter(email=form.cleaned_data['email'], code=form.cleaned_data['code'])
-        if len(res) == 0:
+        ecode = lookups.get_email_code(form.cleaned_data['email'], form.cleaned_data['code'])
+        if ecode is None:
             return ajax('error', '', {
                 'code': [{
                     'message': '邮箱验证码错误',
                     'code': 'invalid',
                 }]
             })
-        if (datetime.datetime.now() - res[0].created_at).total_seconds() > 3600 * 24:
+        if (datetime.datetime.now() - ecode.created_at).total_seconds() > 3600 * 24:
             return ajax('error', '', {
                 'code': [{
                     'message': '邮箱验证码已失效，请重新发送',
@@ -173,9 +207,8 @@ def reset_password(request):
                 }]
             })
         EmailCode(email=form.cleaned_data['email']).delete()
-        user = users[0]
         user.set_password(form.cleaned_data['password'])
-        user.save()
+        user.save(update_fields=['password'])
         return ajax('success', '密码重置成功')
     else:
         return ajax('error', '', form.errors.get_json_data())
@@ -186,8 +219,7 @@ def reset_password_email_code(request):
         return ajax('error', '已登录')
     form = EmailCodeForm(request.POST)
     if form.is_valid():
-        res = User.objects.filter(email=form.cleaned_data['email'])
-        if len(res) == 0:
+        if not lookups.email_registered(form.cleaned_data['email']):
             return ajax('error', '', {
                 'email': [{
                     'message': '邮箱不存在',
@@ -196,9 +228,7 @@ def reset_password_email_code(request):
             })
         ecode = EmailCode(email=form.cleaned_data['email'], code=random.randint(100000, 999999))
         ecode.save()
-        aliyun_mail_sender = AliyunMailSender(settings.MAIL_ACCESS_KEY, settings.MAIL_ACCESS_SECRET)
-        aliyun_mail_sender.single_send_mail(settings.MAIL_ACCOUNT, '爱分享', ecode.email, email_code_subject,
-                                            email_code_content % ecode.code)
+        outbox.enqueue(ecode.email, email_code_subject, email_code_content % ecode.code)
         return ajax('success', '验证码已发送，请查收邮件')
     else:
         return ajax('error', '', form.errors.get_json_data())
@@ -207,35 +237,41 @@ def reset_password_email_code(request):
 def user_info(request, pk):
     if not request.user.is_authenticated:
         return ajax('error', '请先登录')
-    users = User.objects.filter(pk=pk, is_active=True)
-    if len(users) == 0:
+    version = User.objects.filter(pk=pk, is_active=True).values_list('version', flat=True).first()
+    if version is None:
         return ajax('error', '用户不存在或未激活')
-    return ajax('success', '', users[0].to_dict(lite=request.user.pk != pk))
+    validators = conditional.Validators(request.user.pk, pk, version)
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    # 缓存内容不旧于校验值中的版本号, 避免新校验值搭配旧内容
+    user = caching.user_dict(pk, lite=request.user.pk != pk, version=version)
+    return validators.apply(ajax('success', '', fieldsets.prune(user, fieldsets.parse(request))))
 
 
 def disable_user(request, pk):
     if not request.user.is_superuser:
         return ajax('error', '无权访问该页面')
-    users = User.objects.filter(pk=pk, is_active=True)
-    if len(users) == 0:
+    user = lookups.get_user(pk, is_active=True)
+    if user is None:
         return ajax('error', '用户不存在或未激活')
-    if users[0].is_superuser:
+    if user.is_superuser:
         return ajax('error', '无权封禁此用户')
-    users[0].is_active = False
-    users[0].save()
+    user.is_active = False
+    user.save(update_fields=['is_active'])
     return ajax('success', '封禁用户成功')
 
 
 def enable_user(request, pk):
     if not request.user.is_superuser:
         return ajax('error', '无权访问该页面')
-    users = User.objects.filter(pk=pk, is_active=False)
-    if len(users) == 0:
+    user = lookups.get_user(pk, is_active=False)
+    if user is None:
         return ajax('error', '用户不存在或已激活')
-    if users[0].is_superuser:
+    if user.is_superuser:
         return ajax('error', '无权激活此用户')
-    users[0].is_active = True
-    users[0].save()
+    user.is_active = True
+    user.save(update_fields=['is_active'])
     return ajax('success', '激活用户成功')
 
 
@@ -249,7 +285,8 @@ def modify_user_info(request):
         user.school = form.cleaned_data['school']
         user.major = form.cleaned_data['major']
         user.tel = form.cleaned_data['tel']
-        user.save()
+        # 只写修改的列, 不覆盖并发更新的计数与余额
+        user.save(update_fields=['nickname', 'school', 'major', 'tel'])
         return ajax('success', '修改成功')
     else:
         return ajax('error', '', form.errors.get_json_data())
@@ -262,7 +299,7 @@ def modify_user_motto(request):
     if form.is_valid():
         user = request.user
         user.motto = form.cleaned_data['motto']
-        user.save()
+        user.save(update_fields=['motto'])
         return ajax('success', '修改成功')
     else:
         return ajax('error', '', form.errors.get_json_data())
@@ -289,7 +326,7 @@ def modify_password(request):
                 }]
             })
         user.set_password(form.cleaned_data['password'])
-        user.save()
+        user.save(update_fields=['password'])
         login(request, user)
         return ajax('success', '密码修改成功')
     else:
@@ -302,7 +339,7 @@ def upload_avatar(request):
     form = UploadImageForm(request.POST, request.FILES)
     if form.is_valid():
         request.user.avatar = request.FILES['image']
-        request.user.save()
+        request.user.save(update_fields=['avatar'])
         return ajax('success', '上传成功', {
             'avatar': settings.MEDIA_URL + request.user.avatar.name
         })
@@ -330,12 +367,12 @@ def send_message(request):
         return ajax('error', '请先登录')
     form = MessageForm(request.POST)
     if form.is_valid():
-        users = User.objects.filter(pk=form.cleaned_data['to_user'], is_active=True)
-        if len(users) == 0:
+        to_user = lookups.get_active_user(form.cleaned_data['to_user'])
+        if to_user is None:
             return ajax('error', '用户不存在或未激活')
-        if users[0] == request.user:
+        if to_user == request.user:
             return ajax('error', '不能给自己发送信息')
-        message = Message(from_user=request.user, to_user=users[0], content=form.cleaned_data['content'])
+        message = Message(from_user=request.user, to_user=to_user, content=form.cleaned_data['content'])
         message.save()
         return ajax('success', '发送成功')
     else:
@@ -345,38 +382,34 @@ def send_message(request):
 def message_list(request):
     if not request.user.is_authenticated:
         return ajax('error', '请先登录')
-    messages = Message.objects.filter(to_user=request.user).order_by('-sended_at')
-    if request.GET.get('page'):
-        try:
-            page = int(request.GET.get('page'))
-        except (TypeError, ValueError):
-            return ajax('error', '页码格式错误')
-        paginator = Paginator(messages, 10)
-        if page not in range(1, paginator.num_pages + 1):
-            return ajax('error', '页码范围错误')
-        messages = paginator.get_page(page)
-        return ajax('success', '', {
-            'page': page,
-            'num_pages': messages.paginator.num_pages,
-            'messages': [message.to_dict() for message in messages]
-        })
-    return ajax('success', '', {
-        'messages': [message.to_dict() for message in messages]
-    })
+    fields = fieldsets.parse(request)
+    messages = Message.objects.filter(to_user=request.user)
+    if fieldsets.wants(fields, 'user'):
+        messages = messages.select_related('from_user')
+    normalizer = normalize.from_request(request, 'users')
+    if request.GET.get('stream'):
+        return ajax_stream('messages', iterate_pages(messages, message_ordering),
+                           lambda message: normalizer(message.to_dict(fields=fields)), normalizer.tables)
+    try:
+        page = paginate(request, messages, message_ordering)
+    except PageError as e:
+        return ajax('error', str(e))
+    return ajax('success', '', dict(page.extra, messages=[normalizer(message.to_dict(fields=fields))
+                                                          for message in page], **normalizer.tables))
 
 
 def message_view(request, pk):
     if not request.user.is_authenticated:
         return ajax('error', '请先登录')
-    messages = Message.objects.filter(pk=pk)
-    if len(messages) == 0:
+    message = Message.objects.filter(pk=pk).select_related('from_user', 'to_user').first()
+    if message is None:
         return ajax('error', '站内信不存在')
-    if messages[0].to_user != request.user and not request.user.is_superuser:
+    if message.to_user_id != request.user.pk and not request.user.is_superuser:
         return ajax('error', '无权访问该页面')
-    if messages[0].to_user == request.user:
-        messages[0].is_read = True
-        messages[0].save()
-    return ajax('success', '', messages[0].to_dict(lite=False))
+    if message.to_user_id == request.user.pk and not message.is_read:
+        message.is_read = True
+        message.save(update_fields=['is_read'])
+    return ajax('success', '', message.to_dict(lite=False, fields=fieldsets.parse(request)))
 
 
 def follow(request):
@@ -384,112 +417,100 @@ def follow(request):
         return ajax('error', '请先登录')
     form = FollowForm(request.POST)
     if form.is_valid():
-        users = User.objects.filter(pk=form.cleaned_data['following'], is_active=True)
-        if len(users) == 0:
+        following_user = lookups.get_active_user(form.cleaned_data['following'])
+        if following_user is None:
             return ajax('error', '用户不存在或未激活')
-        if users[0] == request.user:
+        if following_user == request.user:
             return ajax('error', '不能关注自己')
         user = request.user
-        follows = Follow.objects.filter(follower=user, following=users[0])
-        if len(follows) > 0:
-            user.following_amount -= 1
-            user.save()
-            users[0].follower_amount -= 1
-            users[0].save()
-            follows[0].delete()
-            return ajax('success', '取消关注成功')
-        user.following_amount += 1
-        user.save()
-        users[0].follower_amount += 1
-        users[0].save()
-        new_follow = Follow(follower=user, following=users[0])
-        new_follow.save()
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(follower=user, following=following_user).delete()
+            if deleted:
+                counters.update(User, user.pk, following_amount=-1)
+                counters.update(User, following_user.pk, follower_amount=-1)
+                feed.remove(user, following_user)
+                return ajax('success', '取消关注成功')
+            try:
+                with transaction.atomic():
+                    Follow(follower=user, following=following_user).save()
+            except IntegrityError:
+                return ajax('success', '关注成功')
+            counters.update(User, user.pk, following_amount=1)
+            counters.update(User, following_user.pk, follower_amount=1)
+            feed.backfill(user, following_user)
         return ajax('success', '关注成功')
     else:
         return ajax('error', '', form.errors.get_json_data())
 
 
+def follow_list(request, follows, related):
+    # related 为输出的一方: following(我关注的) 或 follower(关注我的)
+    fields = fieldsets.parse(request)
+    if fieldsets.wants(fields, 'user'):
+        follows = follows.select_related(related)
+    normalizer = normalize.from_request(request, 'users')
+
+    def serialize(follow_item):
+        return normalizer(fieldsets.prune({
+            'user': getattr(follow_item, related).to_dict(fields=fieldsets.nested(fields, 'user'))
+            if fieldsets.wants(fields, 'user') else None,
+            'followed_at': follow_item.followed_at
+        }, fields))
+
+    if request.GET.get('stream'):
+        return ajax_stream('follows', iterate_pages(follows, follow_ordering), serialize, normalizer.tables)
+    try:
+        page = paginate(request, follows, follow_ordering)
+    except PageError as e:
+        return ajax('error', str(e))
+    return ajax('success', '', dict(page.extra, follows=[serialize(follow_item) for follow_item in page],
+                                    **normalizer.tables))
+
+
+def feed_list(request):
+    if not request.user.is_authenticated:
+        return ajax('error', '请先登录')
+    fields = fieldsets.parse(request)
+    try:
+        page = feed.page(request.user, request.GET.get('cursor'), fields)
+    except PageError as e:
+        return ajax('error', str(e))
+    normalizer = normalize.from_request(request, 'users', 'subjects')
+    serialize = NoteProjection(fields).serializer(normalizer)
+    return ajax('success', '', dict(page.extra, notes=[serialize(row) for row in page], **normalizer.tables))
+
+
 def following(request):
     if not request.user.is_authenticated:
         return ajax('error', '请先登录')
-    follows = Follow.objects.filter(follower=request.user).order_by('-followed_at')
-    if request.GET.get('page'):
-        try:
-            page = int(request.GET.get('page'))
-        except (TypeError, ValueError):
-            return ajax('error', '页码格式错误')
-        paginator = Paginator(follows, 10)
-        if page not in range(1, paginator.num_pages + 1):
-            return ajax('error', '页码范围错误')
-        follows = paginator.get_page(page)
-        return ajax('success', '', {
-            'page': page,
-            'num_pages': follows.paginator.num_pages,
-            'follows': [{
-                'user': follow_item.following.to_dict(),
-                'followed_at': follow_item.followed_at.strftime("%Y-%m-%d %H:%M:%S")
-            } for follow_item in follows]
-        })
-    return ajax('success', '', {
-        'follows': [{
-            'user': follow_item.following.to_dict(),
-            'followed_at': follow_item.followed_at.strftime("%Y-%m-%d %H:%M:%S")
-        } for follow_item in follows]
-    })
+    return follow_list(request, Follow.objects.filter(follower=request.user), 'following')
 
 
 def followers(request):
     if not request.user.is_authenticated:
         return ajax('error', '请先登录')
-    follows = Follow.objects.filter(following=request.user).order_by('-followed_at')
-    if request.GET.get('page'):
-        try:
-            page = int(request.GET.get('page'))
-        except (TypeError, ValueError):
-            return ajax('error', '页码格式错误')
-        paginator = Paginator(follows, 10)
-        if page not in range(1, paginator.num_pages + 1):
-            return ajax('error', '页码范围错误')
-        follows = paginator.get_page(page)
-        return ajax('success', '', {
-            'page': page,
-            'num_pages': follows.paginator.num_pages,
-            'follows': [{
-                'user': follow_item.follower.to_dict(),
-                'followed_at': follow_item.followed_at.strftime("%Y-%m-%d %H:%M:%S")
-            } for follow_item in follows]
-        })
-    return ajax('success', '', {
-        'follows': [{
-            'user': follow_item.follower.to_dict(),
-            'followed_at': follow_item.followed_at.strftime("%Y-%m-%d %H:%M:%S")
-        } for follow_item in follows]
-    })
+    return follow_list(request, Follow.objects.filter(following=request.user), 'follower')
 
 
 def subject_list(request):
     if not request.user.is_authenticated:
         return ajax('error', '请先登录')
-    subjects = Subject.objects.filter(defunct=False).order_by('-added_at')
+    snapshot = catalog.get()
+    validators = conditional.Validators(snapshot.digest, last_modified=snapshot.last_modified)
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    positions = range(len(snapshot.subjects))
     if request.GET.get('name'):
-        subjects = subjects.filter(name__icontains=request.GET.get('name'))
-    if request.GET.get('page'):
-        try:
-            page = int(request.GET.get('page'))
-        except (TypeError, ValueError):
-            return ajax('error', '页码格式错误')
-        paginator = Paginator(subjects, 10)
-        if page not in range(1, paginator.num_pages + 1):
-            return ajax('error', '页码范围错误')
-        subjects = paginator.get_page(page)
-        return ajax('success', '', {
-            'page': page,
-            'num_pages': subjects.paginator.num_pages,
-            'subjects': [subject.to_dict() for subject in subjects]
-        })
-    return ajax('success', '', {
-        'subjects': [subject.to_dict() for subject in subjects]
-    })
+        positions = snapshot.search(request.GET.get('name'))
+    if request.GET.get('stream'):
+        return validators.apply(ajax_encoded(snapshot.render(positions, {})))
+    try:
+        page = paginate_list(request, positions, [snapshot.keys[position] for position in positions], Subject,
+                             ('added_at', 'id'))
+    except PageError as e:
+        return ajax('error', str(e))
+    return validators.apply(ajax_encoded(snapshot.render(page, page.extra)))
 
 
 def add_subject(request):
@@ -497,11 +518,11 @@ def add_subject(request):
         return ajax('error', '无权访问该页面')
     form = SubjectForm(request.POST)
     if form.is_valid():
-        subjects = Subject.objects.filter(name=form.cleaned_data['name'])
-        if len(subjects) > 0:
-            if subjects[0].defunct:
-                subjects[0].defunct = False
-                subjects[0].save()
+        subject = Subject.objects.filter(name=form.cleaned_data['name']).first()
+        if subject is not None:
+            if subject.defunct:
+                subject.defunct = False
+                subject.save(update_fields=['defunct', 'last_updated_at'])
                 return ajax('success', '添加成功')
             return ajax('error', '科目已存在')
         subject = Subject(name=form.cleaned_data['name'])
@@ -516,11 +537,12 @@ def modify_subject(request, pk):
         return ajax('error', '无权访问该页面')
     form = SubjectForm(request.POST)
     if form.is_valid():
-        subjects = Subject.objects.filter(pk=pk, defunct=False)
-        if len(subjects) == 0:
+        subject = lookups.get_subject(pk)
+        if subject is None:
             return ajax('error', '科目不存在')
-        subjects[0].name = form.cleaned_data['name']
-        subjects[0].save()
+        subject.name = form.cleaned_data['name']
+        # 笔记数量由 counters 并发更新, 只写修改的列
+        subject.save(update_fields=['name', 'last_updated_at'])
         return ajax('success', '修改成功')
     else:
         return ajax('error', '', form.errors.get_json_data())
@@ -529,99 +551,209 @@ def modify_subject(request, pk):
 def delete_subject(request, pk):
     if not request.user.is_superuser:
         return ajax('error', '无权访问该页面')
-    subjects = Subject.objects.filter(pk=pk, defunct=False)
-    if len(subjects) == 0:
+    subject = lookups.get_subject(pk)
+    if subject is None:
         return ajax('error', '科目不存在')
-    subjects[0].defunct = True
-    subjects[0].save()
+    subject.defunct = True
+    subject.save(update_fields=['defunct', 'last_updated_at'])
     return ajax('success', '删除成功')
 
 
+def note_list_validators(request, page, marks):
+    # 行中已包含输出的全部列, 以本页数据作为校验值, 计数与作者、科目的变化同样能被发现
+    rows = list(page)
+    last_modified = max((row.last_updated_at for row in rows), default=None)
+    return conditional.Validators(request.user.pk, rows, sorted(page.extra.items()), sorted(marks.items()),
+                                  last_modified=last_modified)
+
+
+def mark_notes(request, fields, rows, marks, reacted=False, accessible=False):
+    # 换成这批笔记的附加字段: 尚未写回的点赞与收藏量, 以及按需查询的当前用户状态(是否已点赞/收藏, 能否阅读),
+    # 每种状态每批一次查询
+    marks.clear()
+    for row in rows:
+        for key, amount in reactions.pending(row.id).items():
+            if amount and hasattr(row, key):
+                marks.setdefault(row.id, {})[key] = getattr(row, key) + amount
+    if reacted:
+        for pk, reacts in reactions.marks(request.user, [row.id for row in rows], fields).items():
+            marks.setdefault(pk, {}).update(reacts)
+    if accessible:
+        for pk, access in entitlements.marks(request.user, rows).items():
+            marks.setdefault(pk, {}).update(access)
+    return rows
+
+
+def wants_marks(request, param, fields, *keys):
+    # ?<param>=1 时附加当前用户相关的字段, ?fields 中不含这些字段时忽略
+    return bool(request.GET.get(param)) and any(fieldsets.wants(fields, key) for key in keys)
+
+
 def note_list(request):
-    notes = Note.objects.filter(is_draft=False, defunct=False).order_by('-last_updated_at')
+    notes = Note.objects.filter(is_draft=False, defunct=False)
     if request.GET.get('subject'):
-        subjects = Subject.objects.filter(pk=request.GET.get('subject'))
-        if len(subjects) == 0:
+        if not lookups.subject_exists(request.GET.get('subject')):
             return ajax('error', '科目不存在')
-        notes = notes.filter(subject=subjects[0])
+        notes = notes.filter(subject=request.GET.get('subject'))
     if request.GET.get('title'):
-        notes = notes.filter(title__icontains=request.GET.get('title'))
+        notes = search.filter_notes(notes, request.GET.get('title'), title_only=True)
+    ordering, extra = note_ordering, ()
+    if request.GET.get('keyword'):
+        notes = search.search_notes(notes, request.GET.get('keyword'))
+        ordering, extra = search.ranked_ordering, ('search_score',)
     if request.GET.get('user'):
-        users = User.objects.filter(pk=request.GET.get('user'))
-        if len(users) == 0:
+        if not lookups.user_exists(request.GET.get('user')):
             return ajax('error', '用户不存在')
-        notes = notes.filter(user=users[0])
-    if request.GET.get('page'):
-        try:
-            page = int(request.GET.get('page'))
-        except (TypeError, ValueError):
-            return ajax('error', '页码格式错误')
-        paginator = Paginator(notes, 10)
-        if page not in range(1, paginator.num_pages + 1):
-            return ajax('error', '页码范围错误')
-        notes = paginator.get_page(page)
-        return ajax('success', '', {
-            'page': page,
-            'num_pages': notes.paginator.num_pages,
-            'notes': [note.to_dict() for note in notes]
-        })
-    return ajax('success', '', {
-        'notes': [note.to_dict() for note in notes]
-    })
+        notes = notes.filter(user=request.GET.get('user'))
+    fields = fieldsets.parse(request)
+    reacted = wants_marks(request, 'reactions', fields, *reactions.KINDS)
+    # 判断能否阅读需要额外查询 is_free 与作者
+    accessible = wants_marks(request, 'accessible', fields, 'is_accessible')
+    if accessible:
+        extra += ('is_free', 'user_id')
+    projection = NoteProjection(fields)
+    project = partial(projection.rows, extra=extra)
+    normalizer = normalize.from_request(request, 'users', 'subjects')
+    marks = {}
+    serialize = projection.serializer(normalizer, marks)
+    if request.GET.get('stream'):
+        pages = (mark_notes(request, fields, rows, marks, reacted, accessible)
+                 for rows in iterate_pages(notes, ordering, project=project))
+        return ajax_stream('notes', pages, serialize, normalizer.tables)
+    try:
+        page = paginate(request, notes, ordering, project=project)
+    except PageError as e:
+        return ajax('error', str(e))
+    mark_notes(request, fields, page, marks, reacted, accessible)
+    validators = note_list_validators(request, page, marks)
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    return validators.apply(ajax('success', '', dict(page.extra, notes=[serialize(row) for row in page],
+                                                     **normalizer.tables)))
+
+
+def trending_list(request):
+    subject = request.GET.get('subject') or None
+    if subject is not None and not lookups.subject_exists(subject):
+        return ajax('error', '科目不存在')
+    # 只读取预先计算并序列化的排行, 不查询笔记表
+    entries = list(TrendingNote.objects.filter(subject=subject).order_by('rank').values_list('payload', 'computed_at'))
+    computed_at = entries[0][1] if entries else None
+    validators = conditional.Validators(subject, computed_at, last_modified=computed_at)
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    return validators.apply(ajax_encoded(trending.render([payload for payload, _ in entries],
+                                                         {'computed_at': computed_at})))
 
 
 def draft_list(request):
     if not request.user.is_authenticated:
         return ajax('error', '请先登录')
-    notes = Note.objects.filter(user=request.user, is_draft=True, defunct=False).order_by('-last_updated_at')
+    notes = Note.objects.filter(user=request.user, is_draft=True, defunct=False)
     if request.GET.get('subject'):
-        subjects = Subject.objects.filter(pk=request.GET.get('subject'))
-        if len(subjects) == 0:
+        if not lookups.subject_exists(request.GET.get('subject')):
             return ajax('error', '科目不存在')
-        notes = notes.filter(subject=subjects[0])
+        notes = notes.filter(subject=request.GET.get('subject'))
     if request.GET.get('title'):
-        notes = notes.filter(title__icontains=request.GET.get('title'))
-    if request.GET.get('page'):
-        try:
-            page = int(request.GET.get('page'))
-        except (TypeError, ValueError):
-            return ajax('error', '页码格式错误')
-        paginator = Paginator(notes, 10)
-        if page not in range(1, paginator.num_pages + 1):
-            return ajax('error', '页码范围错误')
-        notes = paginator.get_page(page)
-        return ajax('success', '', {
-            'page': page,
-            'num_pages': notes.paginator.num_pages,
-            'notes': [note.to_dict() for note in notes]
-        })
-    return ajax('success', '', {
-        'notes': [note.to_dict() for note in notes]
-    })
+        notes = search.filter_notes(notes, request.GET.get('title'), title_only=True)
+    ordering, extra = note_ordering, ()
+    if request.GET.get('keyword'):
+        notes = search.search_notes(notes, request.GET.get('keyword'))
+        ordering, extra = search.ranked_ordering, ('search_score',)
+    fields = fieldsets.parse(request)
+    accessible = wants_marks(request, 'accessible', fields, 'is_accessible')
+    if accessible:
+        extra += ('is_free', 'user_id')
+    projection = NoteProjection(fields)
+    project = partial(projection.rows, extra=extra)
+    normalizer = normalize.from_request(request, 'users', 'subjects')
+    # 草稿不能被点赞或收藏
+    marks = {}
+    serialize = projection.serializer(normalizer, marks)
+    if request.GET.get('stream'):
+        pages = (mark_notes(request, fields, rows, marks, accessible=accessible)
+                 for rows in iterate_pages(notes, ordering, project=project))
+        return ajax_stream('notes', pages, serialize, normalizer.tables)
+    try:
+        page = paginate(request, notes, ordering, project=project)
+    except PageError as e:
+        return ajax('error', str(e))
+    mark_notes(request, fields, page, marks, accessible=accessible)
+    validators = note_list_validators(request, page, marks)
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    return validators.apply(ajax('success', '', dict(page.extra, notes=[serialize(row) for row in page],
+                                                     **normalizer.tables)))
 
 
 def note_view(request, pk):
     if not request.user.is_authenticated:
         return ajax('error', '请先登录')
-    notes = Note.objects.filter(pk=pk, defunct=False)
-    if len(notes) == 0 or notes[0].subject.defunct:
+    visible = lookups.get_note_versions(pk)
+    if visible is None:
         return ajax('error', '笔记不存在')
-    if not notes[0].is_free and not request.user.is_superuser:
-        purchases = Purchased.objects.filter(user=request.user, note=notes[0])
-        if len(purchases) == 0:
-            return ajax('error', '无权访问该页面')
-    comments = Comment.objects.filter(note=pk, defunct=False)
-    for comment in comments:
-        if comment.upp_comment and comment.upp_comment.defunct:
-            comment.defunct = True
-            comment.save()
-    comments = comments.filter(defunct=False)
-    notes[0].reading_amount += 1
-    notes[0].save()
-    return ajax('success', '', {
-        'note': notes[0].to_dict(lite=False),
-        'comments': [comment.to_dict() for comment in comments]
-    })
+    if not entitlements.can_access(request.user, visible):
+        return ajax('error', '无权访问该页面')
+    fields = fieldsets.parse(request)
+    # 阅读量每次访问都会变化, 不计入校验值
+    reading_amount = reading_counter.add(visible.pk)
+    pending = reactions.pending(visible.pk)
+    marks = reactions.marks(request.user, [visible.pk], fields).get(visible.pk, {})
+    validators = conditional.Validators(
+        request.user.pk, visible.last_updated_at, visible.comment_amount, visible.liking_amount,
+        visible.collect_amount, visible.purchase_amount, visible.user_version, visible.subject_updated_at,
+        visible.subject_note_amount, visible.comments_updated_at, sorted(pending.items()), sorted(marks.items()),
+        last_modified=max(filter(None, (visible.last_updated_at, visible.subject_updated_at,
+                                        visible.comments_updated_at))))
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    note = caching.note_dict(visible.pk, visible)
+    note['reading_amount'] += reading_amount
+    for key, amount in pending.items():
+        note[key] += amount
+    note = dict(fieldsets.prune(note, fields), **marks)
+    comments = thread_page(visible, None)
+    return validators.apply(ajax('success', '', {
+        'note': note,
+        'comments': comments.object_list,
+        'comments_next_cursor': comments.extra['next_cursor']
+    }))
+
+
+def comment_list(request, pk):
+    if not request.user.is_authenticated:
+        return ajax('error', '请先登录')
+    note = lookups.visible_notes(pk=pk).only('is_free', 'user').first()
+    if note is None:
+        return ajax('error', '笔记不存在')
+    if not entitlements.can_access(request.user, note):
+        return ajax('error', '无权访问该页面')
+    try:
+        page = thread_page(note, request.GET.get('cursor'), fields=fieldsets.parse(request))
+    except PageError as e:
+        return ajax('error', str(e))
+    normalizer = normalize.from_request(request, 'users')
+    return ajax('success', '', dict(page.extra, comments=normalizer(page.object_list), **normalizer.tables))
+
+
+def comment_replies(request, pk):
+    if not request.user.is_authenticated:
+        return ajax('error', '请先登录')
+    comment = lookups.visible_comments(pk=pk, upp_comment__isnull=True).select_related('user', 'note').first()
+    if comment is None:
+        return ajax('error', '评论不存在')
+    if not entitlements.can_access(request.user, comment.note):
+        return ajax('error', '无权访问该页面')
+    try:
+        page = reply_page(comment, request.GET.get('cursor'), fields=fieldsets.parse(request))
+    except PageError as e:
+        return ajax('error', str(e))
+    normalizer = normalize.from_request(request, 'users')
+    return ajax('success', '', dict(page.extra, replies=normalizer(page.object_list), **normalizer.tables))
 
 
 def add_note(request):
@@ -629,10 +761,10 @@ def add_note(request):
         return ajax('error', '请先登录')
     form = AddNoteForm(request.POST)
     if form.is_valid():
-        subjects = Subject.objects.filter(pk=form.cleaned_data['subject'], defunct=False)
-        if len(subjects) == 0:
+        subject = lookups.get_subject(form.cleaned_data['subject'])
+        if subject is None:
             return ajax('error', '科目不存在')
-        note = Note(user=request.user, subject=subjects[0], title=form.cleaned_data['title'],
+        note = Note(user=request.user, subject=subject, title=form.cleaned_data['title'],
                     content=form.cleaned_data['content'])
         if form.cleaned_data['is_draft']:
             note.is_draft = True
@@ -654,9 +786,11 @@ def add_note(request):
                     }]
                 })
             note.price = form.cleaned_data['price']
-        subjects[0].note_amount += 1
-        subjects[0].save()
-        note.save()
+        with transaction.atomic():
+            note.save()
+            counters.update(Subject, subject.pk, note_amount=1)
+            search.index_note(note)
+            feed.fan_out(note)
         return ajax('success', '添加成功')
     else:
         return ajax('error', '', form.errors.get_json_data())
@@ -667,14 +801,16 @@ def modify_note(request, pk):
         return ajax('error', '请先登录')
     form = ModifyNoteForm(request.POST)
     if form.is_valid():
-        notes = Note.objects.filter(pk=pk, defunct=False)
-        if len(notes) == 0 or notes[0].subject.defunct:
+        note = lookups.get_visible_note(pk)
+        if note is None:
             return ajax('error', '笔记不存在')
-        if notes[0].user != request.user and not request.user.is_superuser:
+        if note.user_id != request.user.pk and not request.user.is_superuser:
             return ajax('error', '无权访问该页面')
-        notes[0].title = form.cleaned_data['title']
-        notes[0].content = form.cleaned_data['content']
-        notes[0].save()
+        note.title = form.cleaned_data['title']
+        note.content = form.cleaned_data['content']
+        # 评论、阅读、点赞等计数由 counters 并发更新, 只写修改的列
+        note.save(update_fields=['title', 'content', 'last_updated_at'])
+        search.index_note(note)
         return ajax('success', '修改成功')
     else:
         return ajax('error', '', form.errors.get_json_data())
@@ -683,30 +819,107 @@ def modify_note(request, pk):
 def delete_note(request, pk):
     if not request.user.is_authenticated:
         return ajax('error', '请先登录')
-    notes = Note.objects.filter(pk=pk, defunct=False)
-    if len(notes) == 0 or notes[0].subject.defunct:
+    note = lookups.visible_notes(pk=pk).only('is_draft', 'subject').first()
+    if note is None:
         return ajax('error', '笔记不存在')
-    if not notes[0].is_draft and not request.user.is_superuser:
+    if not note.is_draft and not request.user.is_superuser:
         return ajax('error', '无权访问该页面')
-    notes[0].subject.note_amount -= 1
-    notes[0].subject.save()
-    notes[0].defunct = True
-    notes[0].save()
+    note.defunct = True
+    with transaction.atomic():
+        note.save(update_fields=['defunct'])
+        counters.update(Subject, note.subject_id, note_amount=-1)
+        search.unindex_note(note)
     return ajax('success', '删除成功')
 
 
+def react(request, pk, kind, message):
+    if not request.user.is_authenticated:
+        return ajax('error', '请先登录')
+    note = lookups.visible_notes(pk=pk, is_draft=False).only('id').first()
+    if note is None:
+        return ajax('error', '笔记不存在')
+    reactions.add(kind, request.user, note)
+    return ajax('success', message)
+
+
+def unreact(request, pk, kind, message):
+    if not request.user.is_authenticated:
+        return ajax('error', '请先登录')
+    reactions.remove(kind, request.user, pk)
+    return ajax('success', message)
+
+
+@require_POST
+def like_note(request, pk):
+    return react(request, pk, 'is_liked', '点赞成功')
+
+
+@require_POST
+def unlike_note(request, pk):
+    return unreact(request, pk, 'is_liked', '取消点赞成功')
+
+
+@require_POST
+def collect_note(request, pk):
+    return react(request, pk, 'is_collected', '收藏成功')
+
+
+@require_POST
+def uncollect_note(request, pk):
+    return unreact(request, pk, 'is_collected', '取消收藏成功')
+
+
+@require_POST
+def purchase_note(request, pk):
+    if not request.user.is_authenticated:
+        return ajax('error', '请先登录')
+    note = lookups.visible_notes(pk=pk, is_draft=False).only('is_free', 'price', 'user').first()
+    if note is None:
+        return ajax('error', '笔记不存在')
+    try:
+        entitlements.purchase(request.user, note)
+    except PurchaseError as e:
+        return ajax('error', str(e))
+    return ajax('success', '购买成功')
+
+
+def collection_list(request):
+    if not request.user.is_authenticated:
+        return ajax('error', '请先登录')
+    collections = Collection.objects.filter(user=request.user, note__defunct=False, note__subject__defunct=False)
+    fields = fieldsets.parse(request)
+    # 不需要笔记时只查询笔记 id
+    projection = NoteProjection(fieldsets.nested(fields, 'note') if fieldsets.wants(fields, 'note') else {'id': None},
+                                prefix='note__')
+    project = partial(projection.rows, extra=('collected_at', 'id'))
+    normalizer = normalize.from_request(request, 'users', 'subjects')
+    serialize_note = projection.serializer(normalizer)
+
+    def serialize(row):
+        return fieldsets.prune({
+            'note': serialize_note(row) if fieldsets.wants(fields, 'note') else None,
+            'collected_at': row.collected_at
+        }, fields)
+
+    if request.GET.get('stream'):
+        return ajax_stream('collections', iterate_pages(collections, collection_ordering, project=project), serialize,
+                           normalizer.tables)
+    try:
+        page = paginate(request, collections, collection_ordering, project=project)
+    except PageError as e:
+        return ajax('error', str(e))
+    return ajax('success', '', dict(page.extra, collections=[serialize(row) for row in page], **normalizer.tables))
+
+
 def comment_view(request, pk):
     if not request.user.is_authenticated:
         return ajax('error', '请先登录')
-    comments = Comment.objects.filter(pk=pk, defunct=False)
-    if len(comments) == 0 or comments[0].note.defunct or (
-            comments[0].upp_comment and comments[0].upp_comment.defunct) or comments[0].note.subject.defunct:
+    comment = lookups.get_comment_versions(pk)
+    if comment is None:
         return ajax('error', '评论不存在')
-    if not comments[0].note.is_free and not request.user.is_superuser:
-        purchases = Purchased.objects.filter(user=request.user, note=comments[0].note)
-        if len(purchases) == 0:
-            return ajax('error', '无权访问该页面')
-    return ajax('success', '', comments[0].to_dict())
+    if not entitlements.can_access(request.user, comment.note):
+        return ajax('error', '无权访问该页面')
+    return ajax('success', '', fieldsets.prune(caching.comment_dict(comment.pk, comment), fieldsets.parse(request)))
 
 
 def add_comment(request):
@@ -714,32 +927,31 @@ def add_comment(request):
         return ajax('error', '请先登录')
     form = AddCommentForm(request.POST)
     if form.is_valid():
-        notes = Note.objects.filter(pk=form.cleaned_data['note'], is_draft=False, defunct=False)
-        if len(notes) == 0 or notes[0].subject.defunct:
+        note = lookups.visible_notes(pk=form.cleaned_data['note'], is_draft=False).only('is_free', 'user').first()
+        if note is None:
             return ajax('error', '笔记不存在')
-        if not notes[0].is_free and not request.user.is_superuser:
-            purchases = Purchased.objects.filter(user=request.user, note=notes[0])
-            if len(purchases) == 0:
-                return ajax('error', '无权访问该页面')
-        comment = Comment(user=request.user, note=notes[0], content=form.cleaned_data['content'])
+        if not entitlements.can_access(request.user, note):
+            return ajax('error', '无权访问该页面')
+        comment = Comment(user=request.user, note=note, content=form.cleaned_data['content'])
         if form.cleaned_data['upp_comment'] and form.cleaned_data['rep_comment']:
-            upp_comments = Comment.objects.filter(pk=form.cleaned_data['upp_comment'], note=notes[0],
-                                                  upp_comment__isnull=True, rep_comment__isnull=True, defunct=False)
-            rep_comments = Comment.objects.filter(pk=form.cleaned_data['rep_comment'], note=notes[0], defunct=False)
-            if len(upp_comments) == 0 or upp_comments[0].note.defunct or upp_comments[0].note.subject.defunct or len(
-                    rep_comments) == 0:
+            upp_comment = Comment.objects.filter(pk=form.cleaned_data['upp_comment'], note=note,
+                                                 upp_comment__isnull=True, rep_comment__isnull=True,
+                                                 defunct=False).first()
+            rep_comment = Comment.objects.filter(pk=form.cleaned_data['rep_comment'], note=note,
+                                                 defunct=False).first()
+            if upp_comment is None or rep_comment is None:
                 return ajax('error', '评论不存在')
-            if upp_comments[0] != rep_comments[0]:
-                if not rep_comments[0].upp_comment or rep_comments[0].upp_comment != upp_comments[0]:
+            if upp_comment != rep_comment:
+                if rep_comment.upp_comment_id != upp_comment.pk:
                     return ajax('error', '评论不存在')
-            comment.upp_comment = upp_comments[0]
-            comment.rep_comment = rep_comments[0]
+            comment.upp_comment = upp_comment
+            comment.rep_comment = rep_comment
         elif (form.cleaned_data['upp_comment'] and not form.cleaned_data['rep_comment']) or (
                 not form.cleaned_data['upp_comment'] and form.cleaned_data['rep_comment']):
             return ajax('error', '评论不存在')
-        notes[0].comment_amount += 1
-        notes[0].save()
-        comment.save()
+        with transaction.atomic():
+            comment.save()
+            counters.update(Note, note.pk, comment_amount=1)
         return ajax('success', '评论成功')
     else:
         return ajax('error', '', form.errors.get_json_data())
@@ -750,14 +962,13 @@ def modify_comment(request, pk):
         return ajax('error', '请先登录')
     form = ModifyCommentForm(request.POST)
     if form.is_valid():
-        comments = Comment.objects.filter(pk=pk, defunct=False)
-        if len(comments) == 0 or comments[0].note.defunct or (
-                comments[0].upp_comment and comments[0].upp_comment.defunct) or comments[0].note.subject.defunct:
+        comment = lookups.get_visible_comment(pk)
+        if comment is None:
             return ajax('error', '评论不存在')
-        if comments[0].user != request.user and not request.user.is_superuser:
+        if comment.user_id != request.user.pk and not request.user.is_superuser:
             return ajax('error', '无权访问该页面')
-        comments[0].content = form.cleaned_data['content']
-        comments[0].save()
+        comment.content = form.cleaned_data['content']
+        comment.save()
         return ajax('success', '修改成功')
     else:
         return ajax('error', '', form.errors.get_json_data())
@@ -766,14 +977,26 @@ def modify_comment(request, pk):
 def delete_comment(request, pk):
     if not request.user.is_authenticated:
         return ajax('error', '请先登录')
-    comments = Comment.objects.filter(pk=pk, defunct=False)
-    if len(comments) == 0 or comments[0].note.defunct or (
-            comments[0].upp_comment and comments[0].upp_comment.defunct) or comments[0].note.subject.defunct:
+    comment = lookups.visible_comments(pk=pk).only('user', 'note').first()
+    if comment is None:
         return ajax('error', '评论不存在')
-    if not comments[0].user == request.user and not request.user.is_superuser:
+    if comment.user_id != request.user.pk and not request.user.is_superuser:
         return ajax('error', '无权访问该页面')
-    comments[0].note.comment_amount -= 1
-    comments[0].note.save()
-    comments[0].defunct = True
-    comments[0].save()
+    comment.defunct = True
+    with transaction.atomic():
+        comment.save(update_fields=['defunct'])
+        replies = Comment.objects.filter(upp_comment=comment, defunct=False).update(defunct=True)
+        counters.update(Note, comment.note_id, comment_amount=-1 - replies)
     return ajax('success', '删除成功')
+
+
+def profiling_stats(request):
+    if not request.user.is_superuser:
+        return ajax('error', '无权访问该页面')
+    stats = profiling.snapshot()
+    if request.GET.get('reset'):
+        profiling.reset()
+    return ajax('success', '', {
+        'sample_rate': settings.PROFILING_SAMPLE_RATE if settings.PROFILING_ENABLED else 0,
+        'views': stats
+    })
@@ -34,6 +34,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'unireare.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,3 +93,106 @@ CORS_ORIGIN_ALLOW_ALL = True
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+
+# List
+
+LIST_MAX_SIZE = 100
+
+LIST_STREAM_CHUNK_SIZE = 500
+
+# Counter
+
+READING_COUNT_FLUSH_INTERVAL = 10
+
+LIKING_COUNT_FLUSH_INTERVAL = 10
+
+COLLECT_COUNT_FLUSH_INTERVAL = 10
+
+# Comment
+
+COMMENT_REPLY_PREVIEW = 3
+
+# Feed
+
+# 粉丝数达到该值的作者发布笔记时不写入粉丝时间线, 由粉丝读取时合并
+FEED_FANOUT_MAX_FOLLOWERS = 5000
+
+# 关注后补入时间线的最近笔记数量
+FEED_BACKFILL_SIZE = 50
+
+# Trending
+
+# 每个排行保留的笔记数量
+TRENDING_TOP_K = 50
+
+# 热度随发布时间衰减的指数, 越大衰减越快
+TRENDING_GRAVITY = 1.5
+
+TRENDING_WEIGHTS = {
+    'reading_amount': 1,
+    'liking_amount': 5,
+    'collect_amount': 8,
+    'comment_amount': 4,
+    'purchase_amount': 10,
+}
+
+# 只计算最近若干天发布的笔记, None 表示全部
+TRENDING_MAX_AGE_DAYS = 30
+
+# Entitlement
+
+# 进程内缓存已购买笔记的用户数量
+ENTITLEMENT_CACHE_USERS = 10000
+
+# Cache
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Mail
+
+MAIL_ALIAS = '爱分享'
+
+MAIL_TRANSPORT = 'unireare.send_mail.AliyunTransport'
+
+# 进程内发送邮件的线程数; 为 0 时只写入待发邮件, 需要运行 mail_worker 命令发送
+MAIL_OUTBOX_THREADS = 2
+
+MAIL_MAX_ATTEMPTS = 5
+
+MAIL_RETRY_BASE_DELAY = 30
+
+# 线程池检查到期重试邮件的间隔(秒)
+MAIL_RETRY_POLL_INTERVAL = 10
+
+MAIL_SEND_TIMEOUT = 10
+
+MAIL_POOL_SIZE = 10
+
+# JSON
+
+# auto: 安装了 orjson 时使用 orjson, 否则使用标准库 json; 也可指定 'orjson' 或 'stdlib'
+JSON_BACKEND = 'auto'
+
+# Benchmark
+
+BENCHMARK_BUDGET = os.path.join(BASE_DIR, 'benchmark_budget.json')
+
+# Profiling
+
+PROFILING_ENABLED = False
+
+PROFILING_SAMPLE_RATE = 0.01
+
+PROFILING_LOG_FILE = None
+
+PROFILING_LOG_MAX_BYTES = 10 * 1024 * 1024
+
+PROFILING_LOG_BACKUP_COUNT = 5
@@ -0,0 +1,20 @@
+# 基准测试配置: DJANGO_SETTINGS_MODULE=unireare_backend.settings_benchmark python manage.py benchmark
+
+from .settings_base import *
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['*']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'benchmark.sqlite3'),
+    }
+}
+
+MAIL_ACCESS_KEY = ''
+
+MAIL_ACCESS_SECRET = ''
+
+MAIL_ACCOUNT = ''
@@ -0,0 +1,7 @@
+# 测试配置: DJANGO_SETTINGS_MODULE=unireare_backend.settings_test python manage.py test unireare
+
+from .settings_benchmark import *
+
+# 测试数据库使用文件: 并发购买的测试中各线程的连接会等待写锁, SQLite 内存数据库则直接报错;
+# benchmark 仍使用内存数据库, 写入类接口的耗时不受磁盘影响
+DATABASES['default']['TEST'] = {'NAME': os.path.join(BASE_DIR, 'test.sqlite3')}